@@ -13,6 +13,10 @@ import os
 import time
 import stardict
 import codecs
+import json
+import binascii
+import collections
+import functools
 
 
 #----------------------------------------------------------------------
@@ -23,6 +27,78 @@ if sys.version_info[0] >= 3:
 	long = int
 	xrange = range
 
+# 等价于已移除的 cgi.escape(text, True)：只转义 & < > 和双引号
+try:
+	from html import escape as _escape
+except ImportError:
+	from cgi import escape as _escape
+
+def html_escape (text):
+	return _escape(text, False).replace('"', '&quot;')
+
+
+#----------------------------------------------------------------------
+# parallel rendering
+#----------------------------------------------------------------------
+try:
+	from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+	ProcessPoolExecutor = None
+
+RENDER_CHUNK = 2000
+
+_render_func = None
+
+def _render_init (render):
+	global _render_func
+	_render_func = render
+
+# 在工作进程中渲染一块词条，只返回结果，不回传记录
+def _render_chunk (rows):
+	render = _render_func
+	return [ render(word, data) for word, data in rows ]
+
+# 按块批量读取记录，返回 [(word, data), ...]
+def _render_rows (dictionary, words, chunk):
+	batch = getattr(dictionary, 'query_batch', None)
+	for pos in xrange(0, len(words), chunk):
+		part = words[pos:pos + chunk]
+		if batch is not None:
+			records = batch(part)
+		else:
+			records = [ dictionary[word] for word in part ]
+		yield list(zip(part, records))
+
+# 分块读取并渲染词条，按 words 的顺序逐个返回 (word, render(word, data))；
+# jobs 为进程数，默认为 CPU 核数，为 1 时在当前进程内顺序处理。
+# render 须能被 pickle（模块级函数或可 pickle 对象的绑定方法），
+# 同时在途的块不超过 jobs 的两倍，内存占用与词典大小无关。
+def render_ordered (render, dictionary, words, jobs = None, chunk = RENDER_CHUNK):
+	chunk = max(1, chunk)
+	count = (len(words) + chunk - 1) // chunk
+	if ProcessPoolExecutor is None:
+		jobs = 1
+	jobs = max(1, min(jobs or os.cpu_count() or 1, count))
+	if jobs == 1:
+		for rows in _render_rows(dictionary, words, chunk):
+			for word, data in rows:
+				yield word, render(word, data)
+		return
+	pending = collections.deque()
+	with ProcessPoolExecutor(max_workers = jobs, initializer = _render_init,
+			initargs = (render,)) as executor:
+		for rows in _render_rows(dictionary, words, chunk):
+			part = [ word for word, _ in rows ]
+			pending.append((part, executor.submit(_render_chunk, rows)))
+			while len(pending) >= jobs * 2:
+				part, future = pending.popleft()
+				for item in zip(part, future.result()):
+					yield item
+		while pending:
+			part, future = pending.popleft()
+			for item in zip(part, future.result()):
+				yield item
+
 
 #----------------------------------------------------------------------
 # Word Generator
@@ -42,8 +118,48 @@ class Generator (object):
 		self._terms = terms
 		names = ('zk', 'gk', 'ky', 'cet4', 'cet6', 'toefl', 'ielts', 'gre')
 		self._term_name = names
+		self._levels = None
+		self._term_text = None
+
+	# 使用 stardict.DictLevels 分级数组（须由同一个词典生成），
+	# 之后 word_tag / word_level 按记录 id 取数，不再解析字段
+	def use_levels (self, levels):
+		self._levels = levels
+		texts = []
+		for bits in xrange(1 << len(stardict.LEVEL_TAGS)):
+			text = ''
+			for term in self._term_name:
+				index = stardict.LEVEL_TAGS.index(term)
+				if bits & (1 << index):
+					text += self._terms[term]
+			texts.append(text)
+		self._term_text = texts
+		return True
+
+	# 分级数组中对应的下标，没有时返回 -1
+	def _level_index (self, data):
+		levels = self._levels
+		if levels is None:
+			return -1
+		index = data.get('id')
+		if not isinstance(index, (int, long)):
+			return -1
+		if index < 0 or index >= levels.size:
+			return -1
+		return index
 
 	def word_tag (self, data):
+		index = self._level_index(data)
+		if index >= 0:
+			levels = self._levels
+			text = self._term_text[levels.level[index]]
+			frq = levels.frq[index] or '-'
+			bnc = levels.bnc[index] or '-'
+			if bnc == stardict.LEVEL_BNC_INVALID:
+				bnc = '-'
+			if bnc != '-' or frq != '-':
+				text += ' %s/%s'%(frq, bnc)
+			return text.strip()
 		tag = data.get('tag', '')
 		text = ''
 		for term in self._term_name:
@@ -70,6 +186,14 @@ class Generator (object):
 
 	def word_level (self, data):
 		head = ''
+		index = self._level_index(data)
+		if index >= 0:
+			collins = self._levels.collins[index]
+			if collins:
+				head = str(collins)
+			if self._levels.oxford[index]:
+				head = 'K' + head
+			return head
 		collins = data.get('collins', '')
 		if isinstance(collins, str) or isinstance(collins, unicode):
 			if collins in ('', '0'):
@@ -161,53 +285,131 @@ class Generator (object):
 		return desc.replace('\\', '').replace('\n', '')
 
 	def text2html (self, text):
-		import cgi
-		return cgi.escape(text, True).replace('\n', '</br>')
+		return html_escape(text).replace('\n', '</br>')
+
+	# 生成一个星际译王词条的文本，没有释义时返回 None
+	def render_stardict (self, word, data):
+		if not data:
+			return None
+		phonetic = data['phonetic']
+		translation = data['translation']
+		if not translation:
+			translation = data['definition']
+		if not translation:
+			return None
+		head = self.word_level(data)
+		tag = self.word_tag(data)
+		parts = []
+		if phonetic:
+			if head:
+				parts.append('*[' + phonetic + ']   -' + head + '\n')
+			else:
+				parts.append('*[' + phonetic + ']\n')
+		elif head:
+			parts.append('-' + head + '\n')
+		parts.append(translation)
+		exchange = self.word_exchange(data, 0)
+		if exchange:
+			parts.append('\n\n' + exchange)
+		if tag:
+			parts.append('\n(' + tag + ')')
+		return ''.join(parts)
 
 	# 导出星际译王的词典源文件，用于 DictEditor 转换
-	def compile_stardict (self, dictionary, filename, title):
+	def compile_stardict (self, dictionary, filename, title, jobs = None,
+			chunk = RENDER_CHUNK):
 		print('generating ...')
-		words = stardict.tools.dump_map(dictionary, False)
+		words = list(stardict.tools.dump_map(dictionary, False))
 		out = {}
 		pc = stardict.tools.progress(len(words))
-		for word in words:
+		render = self.render_stardict
+		for word, text in render_ordered(render, dictionary, words, jobs, chunk):
 			pc.next()
-			data = dictionary[word]
-			phonetic = data['phonetic']
-			translation = data['translation']
-			if not translation:
-				translation = data['definition']
-			if not translation:
+			if text is None:
 				print('missing: %s'%word)
 				continue
-			head = self.word_level(data)
-			tag = self.word_tag(data)
-			if phonetic:
-				if head:
-					text = '*[' + phonetic + ']   -' + head + '\n'
-				else:
-					text = '*[' + phonetic + ']\n'
-			elif head:
-				text = '-' + head + '\n'
-			else:
-				text = ''
-			text = text + translation
-			exchange = self.word_exchange(data, 0)
-			if exchange:
-				text = text + '\n\n' + exchange
-			if tag:
-				text = text + '\n' + '(' + tag + ')'
 			out[word] = text
 		pc.done()
 		print('saving ...')
 		stardict.tools.export_stardict(out, filename, title)
 		return pc.count
 
+	# 生成一个 Mdx 词条（含词头与结尾的 </>），没有释义时返回 None
+	def render_mdx (self, word, data, mode = None, style = False):
+		if not data:
+			return None
+		phonetic = data['phonetic']
+		translation = data['translation']
+		if not translation:
+			translation = data['definition']
+		if not translation:
+			return None
+		if mode is None:
+			mode = ('name', 'phonetic')
+		text2html = self.text2html
+		head = self.word_level(data)
+		tag = self.word_tag(data)
+		parts = []
+		out = parts.append
+		out(word.replace('\r', '').replace('\n', '') + '\r\n')
+		if 'name' in mode:
+			if not style:
+				out('<b style="font-size:180%%;">%s'%text2html(word))
+				out('</b></br></br>\r\n')
+			else:
+				out('`1`%s`2``2`\r\n'%text2html(word))
+		if 'phonetic' in mode:
+			if phonetic or head:
+				if phonetic:
+					if not style:
+						out('<font color=dodgerblue>')
+						out(text2html(u'[%s]'%phonetic))
+						out('</font>')
+					else:
+						out('`3`' + text2html(u'[%s]'%phonetic))
+				if head:
+					if phonetic:
+						out(' ')
+					if not style:
+						out('<font color=gray>')
+						out(text2html(u'-%s'%head))
+						out('</font>')
+					else:
+						out('`4`' + text2html(u'-%s'%head))
+				if not style:
+					out('</br></br>\r\n')
+				else:
+					out('`2``2`\r\n')
+		for line in translation.split('\n'):
+			line = line.rstrip('\r\n ')
+			out(text2html(line) + ' </br>\r\n')
+		if (not 'phonetic' in mode) and head:
+			if tag:
+				tag = tag + ' -' + head
+			else:
+				tag = '-' + head
+		exchange = self.word_exchange(data, 1)
+		if exchange:
+			if not style:
+				out('</br><font color=gray>')
+				out(text2html(exchange))
+				out('</font>\r\n')
+			else:
+				out(u'`2``4`' + text2html(exchange) + '`2`\r\n')
+		if tag:
+			if not style:
+				out('</br><font color=gray>')
+				out('(%s)'%text2html(tag))
+				out('</font>\r\n')
+			else:
+				out('`2``4`(%s)\r\n'%text2html(tag))
+		out('</>')
+		return ''.join(parts)
+
 	# 导出 Mdx 源文件，然后可以用 MdxBuilder 转换成 .mdx词典
-	def compile_mdx (self, dictionary, filename, mode = None, style = False):
+	def compile_mdx (self, dictionary, filename, mode = None, style = False,
+			jobs = None, chunk = RENDER_CHUNK):
 		words = stardict.tools.dump_map(dictionary, False)
-		fp = codecs.open(filename, 'w', 'utf-8')
-		text2html = self.text2html
 		pc = stardict.tools.progress(len(words))
 		if mode is None:
 			mode = ('name', 'phonetic')
@@ -215,75 +417,17 @@ class Generator (object):
 		stripword = stardict.stripword
 		words = [ k for k in words ]
 		words.sort(key = lambda x: stripword(x))
-		for word in words:
+		render = functools.partial(self.render_mdx, mode = mode, style = style)
+		fp = codecs.open(filename, 'w', 'utf-8')
+		for word, text in render_ordered(render, dictionary, words, jobs, chunk):
 			pc.next()
-			data = dictionary[word]
-			phonetic = data['phonetic']
-			translation = data['translation']
-			if not translation:
-				translation = data['definition']
-			if not translation:
+			if text is None:
 				continue
-			# if pc.count >= 100000:
-			# 	break
-			head = self.word_level(data)
-			tag = self.word_tag(data)
-			fp.write(word.replace('\r', '').replace('\n', '') + '\r\n')
-			if 'name' in mode:
-				if not style:
-					fp.write('<b style="font-size:180%%;">%s'%text2html(word))
-					fp.write('</b></br></br>\r\n')
-				else:
-					fp.write('`1`%s`2``2`\r\n'%text2html(word))
-			if 'phonetic' in mode:
-				if phonetic or head:
-					if phonetic:
-						if not style:
-							fp.write('<font color=dodgerblue>')
-							fp.write(text2html(u'[%s]'%phonetic))
-							fp.write('</font>')
-						else:
-							fp.write('`3`' + text2html(u'[%s]'%phonetic))
-					if head:
-						if phonetic:
-							fp.write(' ')
-						if not style:
-							fp.write('<font color=gray>')
-							fp.write(text2html(u'-%s'%head))
-							fp.write('</font>')
-						else:
-							fp.write('`4`' + text2html(u'-%s'%head))
-					if not style:
-						fp.write('</br></br>\r\n')
-					else:
-						fp.write('`2``2`\r\n')
-			for line in translation.split('\n'):
-				line = line.rstrip('\r\n ')
-				fp.write(text2html(line) + ' </br>\r\n')
-			if (not 'phonetic' in mode) and head:
-				if tag:
-					tag = tag + ' -' + head
-				else:
-					tag = '-' + head
-			exchange = self.word_exchange(data, 1)
-			if exchange:
-				if not style:
-					fp.write('</br><font color=gray>')
-					fp.write(text2html(exchange))
-					fp.write('</font>\r\n')
-				else:
-					fp.write(u'`2``4`' + text2html(exchange) + '`2`\r\n')
-			if tag:
-				if not style:
-					fp.write('</br><font color=gray>')
-					fp.write('(%s)'%text2html(tag))
-					fp.write('</font>\r\n')
-				else:
-					fp.write('`2``4`(%s)\r\n'%text2html(tag))
-			fp.write('</>')
 			if count < len(words) - 1:
-				fp.write('\r\n')
+				text += '\r\n'
+			fp.write(text)
 			count += 1
+		fp.close()
 		pc.done()
 		return pc.count
 
@@ -519,12 +663,19 @@ class Generator (object):
 
 #----------------------------------------------------------------------
 # 解析 resemble.txt 生成辨析释义
+# _resembles 保存所有词组，_words 为 单词 -> 词组编号 的索引，
+# HTML 在查询时才渲染，每个词组每种样式只渲染一次
 #----------------------------------------------------------------------
+RESEMBLE_VERSION = 1
+RESEMBLE_EXTENSION = '.rsdb'
+
 class Resemble (object):
 
 	def __init__ (self):
 		self._resembles = []
 		self._words = {}
+		self._lower = {}
+		self._html = {}
 		self._filename = None
 		self._lineno = 0
 
@@ -590,37 +741,127 @@ class Resemble (object):
 			wt = {'words':tuple(key), 'content':content}
 			uuid = [ n for n in key ]
 			uuid.sort()
-			wt['uuid'] = uuid
+			wt['uuid'] = ', '.join(uuid)
 			self._resembles.append(wt)
 		self._init_refs()
 		return True
 
+	# 建立 单词 -> 词组编号 索引，单词组合相同的词组只保留第一个
 	def _init_refs (self):
-		self._words = {}
 		words = {}
-		existence = {}
-		for wt in self._resembles:
+		first = {}
+		for index, wt in enumerate(self._resembles):
+			if first.setdefault(wt['uuid'], index) != index:
+				continue
 			for word in wt['words']:
-				if not word in words:
-					words[word] = []
-				if not word in existence:
-					existence[word] = {}
-				uuid = wt['uuid']
-				if uuid in existence[word]:
-					continue
-				words[word].append(wt)
-				existence[word][uuid] = 1
+				ids = words.setdefault(word, [])
+				if not ids or ids[-1] != index:
+					ids.append(index)
+		self._words = {}
 		for word in words:
 			self._words[word] = tuple(words[word])
+		self._init_lower()
+		return True
+
+	def _init_lower (self):
+		self._lower = {}
+		self._html = {}
+		for word in self._words:
+			self._lower.setdefault(word.lower(), word)
+		return True
+
+	# 保存为 JSON 索引文件，digest 为源文件的 sha1
+	def compile (self, filename, digest = None):
+		groups = []
+		for wt in self._resembles:
+			groups.append([wt['words'], wt['content'], wt['uuid']])
+		data = {}
+		data['version'] = RESEMBLE_VERSION
+		if digest is not None:
+			data['digest'] = binascii.hexlify(digest).decode('ascii')
+		data['groups'] = groups
+		data['words'] = self._words
+		temp = filename + '.tmp'
+		with codecs.open(temp, 'w', encoding = 'utf-8') as fp:
+			fp.write(json.dumps(data, ensure_ascii = False))
+		os.replace(temp, filename)
+		return True
+
+	# 读取 compile 生成的文件，digest 不一致时返回 False
+	def load_compiled (self, filename, digest = None):
+		with codecs.open(filename, 'r', encoding = 'utf-8') as fp:
+			data = json.loads(fp.read())
+		if data.get('version') != RESEMBLE_VERSION:
+			return False
+		if digest is not None:
+			if data.get('digest') != binascii.hexlify(digest).decode('ascii'):
+				return False
+		resembles = []
+		for words, content, uuid in data['groups']:
+			wt = {}
+			wt['words'] = tuple(words)
+			wt['content'] = [ n if not isinstance(n, list) else tuple(n)
+					for n in content ]
+			wt['uuid'] = uuid
+			resembles.append(wt)
+		self._resembles = resembles
+		self._words = {}
+		for word, ids in data['words'].items():
+			self._words[word] = tuple(ids)
+		self._filename = filename
+		self._init_lower()
+		return True
+
+	# 优先读取同名 .rsdb 索引，不存在或源文件已修改时重新解析并保存
+	def load_cached (self, filename):
+		if not os.path.exists(filename):
+			return self.load(filename)
+		digest = stardict.file_digest(filename)
+		binname = os.path.splitext(filename)[0] + RESEMBLE_EXTENSION
+		if os.path.exists(binname):
+			try:
+				if self.load_compiled(binname, digest):
+					return True
+			except (ValueError, KeyError, IOError, OSError):
+				pass
+		if not self.load(filename):
+			return False
+		try:
+			self.compile(binname, digest)
+		except (IOError, OSError):
+			pass
 		return True
 
+	# 单词所在的所有辨析词组，找不到时忽略大小写再找
+	def groups (self, word):
+		ids = self._words.get(word)
+		if ids is None:
+			ids = self._words.get(self._lower.get(word.lower()), ())
+		return [ self._resembles[i] for i in ids ]
+
+	# 单词的辨析 HTML，没有辨析时返回 None
+	def html (self, word, style = 1):
+		ids = self._words.get(word)
+		if ids is None:
+			ids = self._words.get(self._lower.get(word.lower()), ())
+		if not ids:
+			return None
+		output = []
+		for index in ids:
+			text = self._html.get((index, style))
+			if text is None:
+				text = self.dump_html(self._resembles[index], style)
+				self._html[(index, style)] = text
+			output.append(text)
+		return '</br>\n'.join(output)
+
 	def __len__ (self):
 		return len(self._resembles)
 
 	def __getitem__ (self, key):
 		if isinstance(key, int) or isinstance(key, long):
 			return self._resembles[key]
-		return self._words[key]
+		return tuple([ self._resembles[i] for i in self._words[key] ])
 
 	def __contains__ (self, key):
 		if isinstance(key, int) or isinstance(key, long):
@@ -634,8 +875,7 @@ class Resemble (object):
 		return self._resembles.__iter__()
 
 	def text2html (self, text):
-		import cgi
-		return cgi.escape(text, True).replace('\n', '</br>')
+		return html_escape(text).replace('\n', '</br>')
 
 	def dump_text (self, wt):
 		lines = []
@@ -703,8 +943,7 @@ class Resemble (object):
 			pc.next()
 			if not word:
 				continue
-			wts = [ self.dump_html(wt, 1) for wt in self._words[word] ]
-			words[word] = '</br>\n'.join(wts)
+			words[word] = self.html(word, 1)
 		return words
 
 	def compile_mdx (self, filename):
@@ -733,8 +972,7 @@ class Treasure (object):
 		self.generator = Generator()
 
 	def text2html (self, text):
-		import cgi
-		return cgi.escape(text, True).replace('\n', '</br>')
+		return html_escape(text).replace('\n', '</br>')
 
 	def clear_html (self, text):
 		return text.replace('<', '').replace('>', '').replace('&', '')
@@ -976,15 +1214,23 @@ class Treasure (object):
 		html.append('</div>')
 		return '\n'.join(html)
 
-	def compile_mdx (self, db, name1, name2):
+	# 生成 anki 卡片的正反面，记录不存在时返回 None
+	def render_card (self, word, data):
+		if not data:
+			return None
+		return self.generate_front(data), self.generate_back(data)
+
+	def compile_mdx (self, db, name1, name2, jobs = None, chunk = RENDER_CHUNK):
 		mdx1 = {}
 		mdx2 = {}
-		pc = stardict.tools.progress(len(db))
-		for _, word in db:
+		words = [ word for _, word in db ]
+		pc = stardict.tools.progress(len(words))
+		render = self.render_card
+		for word, card in render_ordered(render, db, words, jobs, chunk):
 			pc.next()
-			data = db[word]
-			mdx1[word] = self.generate_front(data)
-			mdx2[word] = self.generate_back(data)
+			if card is None:
+				continue
+			mdx1[word], mdx2[word] = card
 		pc.done()
 		if os.path.splitext(name1)[-1].lower() == '.mdx':
 			stardict.tools.export_mdx(mdx1, name1, 'anki-front')
@@ -1057,7 +1303,7 @@ if __name__ == '__main__':
 		generator._generate_html(sio, data)
 		print(sio.getvalue().encode('gbk', 'ignore'))
 
-test6()
+	test6()
 
 
 
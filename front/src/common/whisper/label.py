@@ -2,7 +2,14 @@ import os
 import re
 import json
 import sys
-from typing import List, Tuple, Dict, Any
+import glob
+import time
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Any, Callable
 
 # 使用同目录下的 stardict.py 中的 DictCsv
 try:
@@ -10,31 +17,166 @@ try:
 except Exception:
     stardict = None
 
+# 列式二进制输出
+try:
+    import labelpack
+except ImportError:
+    from . import labelpack
+
 # 导入词汇难度分级模块
 try:
-    from vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string
+    from vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string, tag_bits_masks
 except ImportError:
     try:
-        from .vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string
+        from .vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string, tag_bits_masks
     except ImportError:
         VocabLevelChecker = None
         VocabLevel = None
         get_level_from_string = None
+        tag_bits_masks = None
+
+
+# 进程内共享的词典实例：(绝对路径, mtime) -> 词典对象
+_shared_dicts: Dict[Tuple[str, float], Any] = {}
+_shared_lock = threading.Lock()
+
+# 这些词典用 stardict.open_compiled 打开（csv 编译为 .ecdb 后 mmap），其他扩展名交给 open_dict
+COMPILED_DICT_EXTENSIONS = ('.csv', '.txt', '.ecdb')
+
+# SQLite 数据库文件头，open_dict 把其他扩展名的文件都当作 SQLite 词典打开
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# 进程内共享的词形还原表：(绝对路径, mtime) -> stardict.LemmaIndex 或 {衍生词: 词根}
+_shared_lemmas: Dict[Tuple[str, float], Any] = {}
+
+# 默认的词形还原数据（来自 ECDICT 的 lemma.en.txt）
+DEFAULT_LEMMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lemma.en.txt')
+
+# 每个词典实例对应的单词分级缓存（单词 -> (等级位掩码, BNC 词频)），随词典实例释放
+_shared_profiles = weakref.WeakKeyDictionary()
+
+# 分级缓存的容量（单词数），超出时淘汰最久未用的单词
+PROFILE_CACHE_SIZE = 65536
+
+# 每个词典实例对应的分级数组（stardict.DictLevels，没有时为 None）
+_shared_levels = weakref.WeakKeyDictionary()
+
+
+def get_shared_dict(dict_csv_path: str):
+    """返回进程内共享的词典实例，同一文件（路径与 mtime 都相同）只加载一次。
+
+    文件被修改后 mtime 变化，会自动丢弃旧实例并重新加载。
+    """
+    path = os.path.abspath(dict_csv_path)
+    key = (path, os.path.getmtime(path))
+    with _shared_lock:
+        db = _shared_dicts.get(key)
+        if db is None:
+            for old in [k for k in _shared_dicts if k[0] == path]:
+                del _shared_dicts[old]
+            if path.lower().endswith(COMPILED_DICT_EXTENSIONS):
+                db = stardict.open_compiled(path)
+            else:
+                db = stardict.open_dict(path)
+            _shared_dicts[key] = db
+    return db
+
+
+def get_shared_lemmas(lemma_path: str = None):
+    """返回进程内共享的 小写衍生词 -> 词根 表（支持 get），同一文件只加载一次，文件更新后重新加载。"""
+    path = os.path.abspath(lemma_path or DEFAULT_LEMMA_PATH)
+    key = (path, os.path.getmtime(path))
+    with _shared_lock:
+        lemmas = _shared_lemmas.get(key)
+        if lemmas is None:
+            for old in [k for k in _shared_lemmas if k[0] == path]:
+                del _shared_lemmas[old]
+            # 优先 mmap 打开校验过哈希的编译文件（.lemdb），不必重新解析文本
+            lemmas = _shared_lemmas[key] = stardict.open_lemma(path)
+    return lemmas
+
+
+class _ProfileCache(OrderedDict):
+    """有容量上限的分级缓存（LRU），长时间运行、处理大量字幕时内存不会无限增长。"""
+
+    def __init__(self, size: int = PROFILE_CACHE_SIZE):
+        super().__init__()
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.size:
+                self.popitem(last=False)
+
+
+def get_shared_profiles(db) -> Dict[str, Tuple[int, int]]:
+    """返回词典实例对应的分级缓存，供不同等级的 VocabLevelChecker 共用，最多保留 PROFILE_CACHE_SIZE 个单词。"""
+    with _shared_lock:
+        profiles = _shared_profiles.get(db)
+        if profiles is None:
+            profiles = _shared_profiles[db] = _ProfileCache(PROFILE_CACHE_SIZE)
+    return profiles
+
+
+def get_shared_levels(db, dict_csv_path: str):
+    """返回词典旁边由 stardict.compile_levels 生成的分级数组，不存在或已过期时返回 None。"""
+    with _shared_lock:
+        if db in _shared_levels:
+            return _shared_levels[db]
+        levels = _shared_levels[db] = stardict.open_levels(os.path.abspath(dict_csv_path))
+    return levels
+
+
+def invalidate_shared_dict(dict_csv_path: str = None) -> int:
+    """丢弃共享的词典实例（不指定路径则全部丢弃），返回丢弃的数量。
+
+    已经持有旧实例的 Labeler 不受影响，之后新建的 Labeler 会重新加载。
+    """
+    with _shared_lock:
+        if dict_csv_path is None:
+            keys = list(_shared_dicts)
+        else:
+            path = os.path.abspath(dict_csv_path)
+            keys = [k for k in _shared_dicts if k[0] == path]
+        for key in keys:
+            del _shared_dicts[key]
+    return len(keys)
+
+
+# 只抓取字母和撇号组合
+_TOKEN_RE = re.compile(r"[A-Za-z']+")
 
 
 def _tokenize(text: str) -> List[str]:
     """将一句话分词为英文单词列表，保留缩写/撇号（如 there's）。"""
-    # 只抓取字母和撇号组合
-    tokens = re.findall(r"[A-Za-z']+", text)
+    tokens = _TOKEN_RE.findall(text)
     return tokens
 
 
-def _generate_candidates(word: str) -> List[str]:
-    """为单词生成若干候选查找形式（lower, 移除 's, 去掉复数 s 等）。"""
+def _generate_candidates(word: str, lemmas: Dict[str, str] = None) -> List[str]:
+    """为单词生成若干候选查找形式（lower, 词根, 移除 's, 去掉复数 s 等）。
+
+    lemmas 为 {小写衍生词: 词根} 表，给出时词根紧跟原词之后查找，
+    如 went -> go、studies -> study，避免逐个尝试剥离后缀。
+    """
     w = word
     cand = []
     lw = w.lower()
     cand.append(lw)
+    if lemmas:
+        stem = lemmas.get(lw)
+        if stem:
+            cand.append(stem)
     # 去除首尾撇号
     if lw.startswith("'") or lw.endswith("'"):
         cand.append(lw.strip("'"))
@@ -56,136 +198,316 @@ def _generate_candidates(word: str) -> List[str]:
     return res
 
 
+# process_subtitle_file 支持的输出格式
+OUTPUT_FORMATS = ('json', 'stream', 'pack')
+
+# 输出到 JSON 的词典字段
+_ENTRY_FIELDS = ('word', 'phonetic', 'definition', 'translation', 'pos', 'collins',
+                 'oxford', 'tag', 'bnc', 'frq', 'exchange', 'detail', 'audio')
+
+
+def _make_entry(rec: Dict[str, Any], word: str) -> Dict[str, Any]:
+    """复制并规范化词典记录的字段（确保都存在），rec 为空时得到空白结构。"""
+    entry = {name: rec.get(name) or '' for name in _ENTRY_FIELDS}
+    entry['word'] = rec.get('word') or word
+    return entry
+
+
+def _statistics(total_words: int, new_words_count: int) -> Dict[str, Any]:
+    """生词统计信息"""
+    return {
+        'total_words': total_words,
+        'new_words_count': new_words_count,
+        'coverage_rate': round((total_words - new_words_count) / total_words * 100, 2) if total_words > 0 else 0
+    }
+
+
+_tag_masks = None
+
+
+def _level_masks() -> List[int]:
+    """stardict.LEVEL_TAGS 标签位 -> 等级位掩码"""
+    global _tag_masks
+    if _tag_masks is None:
+        _tag_masks = tag_bits_masks(stardict.LEVEL_TAGS)
+    return _tag_masks
+
+
+def _add_new_word(new_words: List[Dict[str, Any]], new_word_keys: set, word_key: str, tok: str,
+                  entry: Dict[str, Any], difficulty: str, blk: Dict[str, Any], compact: bool = False):
+    """把生词加入生词列表，new_word_keys 为已收入的小写单词集合，用于 O(1) 判重。
+
+    compact 为 True 时额外记录 key，首次出现位置只记录句子序号、不复制原文。
+    """
+    if word_key in new_word_keys:
+        return
+    new_word_keys.add(word_key)
+    new_word_keys.add((entry.get('word') or tok).lower())
+    first = {'sentence_index': blk['index']}
+    if not compact:
+        first['sentence_text'] = blk['text']
+    first['timestamp'] = f"{blk['start']} --> {blk['end']}"
+    item = {'word': entry.get('word') or tok}
+    if compact:
+        item['key'] = word_key
+    item['translation'] = entry.get('translation', '')
+    item['difficulty'] = difficulty
+    item['first_occurrence'] = first
+    new_words.append(item)
+
+
+def _read_blocks(subtitle_path: str) -> List[Dict[str, Any]]:
+    """读取字幕并抽取每个字幕块的序号、时间和文本。"""
+    blocks = []  # each: dict(index, start, end, text)
+    if not os.path.exists(subtitle_path):
+        raise FileNotFoundError(subtitle_path)
+
+    with open(subtitle_path, 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.readlines()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if line.isdigit():
+            index = int(line)
+            i += 1
+            if i >= len(lines):
+                break
+            times = lines[i].strip()
+            start, end = ('', '')
+            m = re.match(r"(\d{2}:\d{2}:\d{2}[,\.]\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2}[,\.]\d{3})", times)
+            if m:
+                start, end = m.group(1), m.group(2)
+            i += 1
+            text_lines = []
+            while i < len(lines) and lines[i].strip() != '':
+                text_lines.append(lines[i].rstrip('\n'))
+                i += 1
+            # 跳过空行
+            while i < len(lines) and lines[i].strip() == '':
+                i += 1
+            text = ' '.join([t.strip() for t in text_lines])
+            blocks.append({'index': index, 'start': start, 'end': end, 'text': text})
+        else:
+            i += 1
+    return blocks
+
+
 class Labeler:
-    def __init__(self, dict_csv_path: str = None, user_vocab_level: str = 'cet4'):
+    def __init__(self, dict_csv_path: str = None, user_vocab_level: str = 'cet4', lemma_path: str = None,
+                 use_lemma: bool = True):
         """
         初始化标注器
 
         Args:
             dict_csv_path: 词典 CSV 文件路径
             user_vocab_level: 用户词汇量等级 ('basic', 'cet4', 'cet6', 'toefl', 'ielts', 'gre', 'advanced')
+            lemma_path: 词形还原数据文件，默认为同目录下的 lemma.en.txt（不存在时不做词形还原）
+            use_lemma: 是否在查词时使用词形还原
         """
         self.dict_csv_path = dict_csv_path or os.path.join(os.path.dirname(__file__), 'ecdict.csv')
         self._dict = None
+        self._lemmas = None
+        self._levels = None
         if stardict is None:
             raise RuntimeError('stardict 模块不可用，无法加载词典')
         self._load_dict()
+        if use_lemma:
+            self._load_lemmas(lemma_path)
 
         # 初始化词汇难度检查器
         if VocabLevelChecker is not None:
             vocab_level = get_level_from_string(user_vocab_level)
-            self.level_checker = VocabLevelChecker(vocab_level)
+            self.level_checker = VocabLevelChecker(vocab_level, profiles=get_shared_profiles(self._dict))
         else:
             self.level_checker = None
+        self._checkers = {}
 
     def _load_dict(self):
         if not os.path.exists(self.dict_csv_path):
             raise FileNotFoundError(f'未找到词典文件: {self.dict_csv_path}')
-        # DictCsv 接口在 stardict.py 中实现
-        self._dict = stardict.DictCsv(self.dict_csv_path)
+        # 同一进程内的 Labeler 共享词典实例；底层优先使用 mmap 打开
+        # 编译后的 .ecdb 文件，首次使用或 csv 更新后会自动重新编译
+        self._dict = get_shared_dict(self.dict_csv_path)
+        # 有分级数组时按记录 id 取分级信息，不必解析 tag / bnc 字段
+        self._levels = get_shared_levels(self._dict, self.dict_csv_path)
+
+    def _load_lemmas(self, lemma_path: str = None):
+        if lemma_path is None and not os.path.exists(DEFAULT_LEMMA_PATH):
+            return
+        if lemma_path is not None and not os.path.exists(lemma_path):
+            raise FileNotFoundError(f'未找到词形还原文件: {lemma_path}')
+        self._lemmas = get_shared_lemmas(lemma_path)
 
     def lookup(self, word: str) -> Dict[str, Any]:
         """查找单词并返回词典项（保证返回包含必要字段的 dict）。"""
-        candidates = _generate_candidates(word)
-        for c in candidates:
+        return self.lookup_batch([word])[word.lower()]
+
+    def lookup_batch(self, words: List[str], ids: Dict[str, int] = None) -> Dict[str, Dict[str, Any]]:
+        """批量查找单词，返回 {小写单词: 词典项}；给出 ids 时同时填入 {小写单词: 记录 id}。
+
+        每个不同的小写形式只查找一次：按候选形式逐轮调用词典的
+        query_batch，每一轮只为上一轮仍未命中的单词查询下一个候选。
+        原词未收录时第二轮即查询词根，多数屈折变化两轮内即可命中。
+        """
+        pending = {}
+        for word in words:
+            lw = word.lower()
+            if lw not in pending:
+                pending[lw] = (word, _generate_candidates(word, self._lemmas))
+        result = {}
+        rank = 0
+        while pending:
+            probes = {}  # lowercase word -> candidate of this round
+            for lw, (word, candidates) in pending.items():
+                if rank < len(candidates):
+                    probes[lw] = candidates[rank]
+                else:
+                    # 未找到任何匹配，返回空白结构但包含原词
+                    result[lw] = _make_entry({}, word)
+            if not probes:
+                break
+            keys = list(dict.fromkeys(probes.values()))
             try:
-                rec = self._dict.query(c)
+                records = dict(zip(keys, self._dict.query_batch(keys)))
             except Exception:
-                rec = None
-            if rec:
-                # rec 已经是字典对象，直接返回重要字段（确保存在）
-                # 复制并规范化字段
-                entry = {
-                    'word': rec.get('word') or c,
-                    'phonetic': rec.get('phonetic') or '',
-                    'definition': rec.get('definition') or '',
-                    'translation': rec.get('translation') or '',
-                    'pos': rec.get('pos') or '',
-                    'collins': rec.get('collins') or '',
-                    'oxford': rec.get('oxford') or '',
-                    'tag': rec.get('tag') or '',
-                    'bnc': rec.get('bnc') or '',
-                    'frq': rec.get('frq') or '',
-                    'exchange': rec.get('exchange') or '',
-                    'detail': rec.get('detail') or '',
-                    'audio': rec.get('audio') or '',
-                }
-                return entry
-        # 未找到任何匹配，返回空白结构但包含原词
-        return {
-            'word': word,
-            'phonetic': '',
-            'definition': '',
-            'translation': '',
-            'pos': '',
-            'collins': '',
-            'oxford': '',
-            'tag': '',
-            'bnc': '',
-            'frq': '',
-            'exchange': '',
-            'detail': '',
-            'audio': '',
-        }
+                records = {}
+            remain = {}
+            for lw, cand in probes.items():
+                rec = records.get(cand)
+                if rec:
+                    result[lw] = _make_entry(rec, cand)
+                    if ids is not None and rec.get('id') is not None:
+                        ids[lw] = rec['id']
+                else:
+                    remain[lw] = pending[lw]
+            pending = remain
+            rank += 1
+        return result
+
+    def _label_words(self, tokens_list: List[List[str]]) -> Tuple[Dict[str, Any], Dict[str, Tuple[bool, str]]]:
+        """查找并分级所有单词，返回 ({小写单词: 词典项}, {小写单词: (是否超纲, 难度标签)})。
+
+        每个不同的小写单词只查找、分级一次，所有出现位置共用结果。
+        """
+        ids = {} if self._levels is not None and self.level_checker is not None else None
+        entries = self.lookup_batch([tok for tokens in tokens_list for tok in tokens], ids)
+        if ids:
+            self._load_profiles(entries, ids)
+        labels = {}
+        for tokens in tokens_list:
+            for tok in tokens:
+                word_key = tok.lower()
+                if word_key in labels:
+                    continue
+                entry = entries[word_key]
+                # 判断是否超出用户词汇量
+                is_new_word = False
+                difficulty_label = ''
+                if self.level_checker is not None:
+                    is_new_word, difficulty_label = self.level_checker.classify(tok, entry)
+                labels[word_key] = (is_new_word, difficulty_label)
+        return entries, labels
+
+    def _load_profiles(self, entries: Dict[str, Any], ids: Dict[str, int]):
+        """从分级数组批量取出尚未缓存的单词的分级信息"""
+        profiles = self.level_checker.profiles
+        words, rows = [], []
+        for lw, index in ids.items():
+            word = entries[lw]['word']
+            if word not in profiles and index < len(self._levels):
+                words.append(word)
+                rows.append(index)
+        if not rows:
+            return
+        masks = _level_masks()
+        tag_bits = self._levels.take('level', rows)
+        bncs = self._levels.take('bnc', rows)
+        self.level_checker.load_profiles(words, [masks[bits] for bits in tag_bits], bncs,
+                                         stardict.LEVEL_BNC_INVALID)
+
+    def checker(self, level: str):
+        """返回指定词汇量等级的检查器，与 level_checker 共用单词分级缓存。"""
+        if VocabLevelChecker is None:
+            raise RuntimeError('vocab_level 模块不可用，无法按等级标注')
+        level = level.lower().strip()
+        if level not in self._checkers:
+            if level not in {lv.value for lv in VocabLevel}:
+                raise ValueError(f'未知的词汇量等级: {level}')
+            self._checkers[level] = VocabLevelChecker(get_level_from_string(level),
+                                                      profiles=get_shared_profiles(self._dict))
+        return self._checkers[level]
+
+    def _classify_levels(self, entries: Dict[str, Any], labels: Dict[str, Tuple[bool, str]],
+                         levels: List[str]) -> Tuple[Dict[str, Dict[str, bool]], Dict[str, Any]]:
+        """按多个等级判断每个单词是否超纲，返回 ({小写单词: {等级: 是否超纲}}, {等级: 统计信息})。
 
-    def process_subtitle_file(self, subtitle_path: str, out_json: str = None) -> Dict[str, Any]:
+        生词数与 new_words 的计数方式相同：词典项相同的单词只计一次。
+        """
+        checkers = [(level, self.checker(level)) for level in levels]
+        flags = {}
+        counted = {level: set() for level in levels}
+        new_counts = dict.fromkeys(levels, 0)
+        for word_key in labels:
+            entry = entries[word_key]
+            flags[word_key] = item = {}
+            for level, checker in checkers:
+                is_new_word = item[level] = checker.classify(word_key, entry)[0]
+                if is_new_word and word_key not in counted[level]:
+                    counted[level].add(word_key)
+                    counted[level].add((entry.get('word') or word_key).lower())
+                    new_counts[level] += 1
+        statistics = {level: _statistics(len(labels), new_counts[level]) for level in levels}
+        return flags, statistics
+
+    def process_subtitle_file(self, subtitle_path: str, out_json: str = None, fmt: str = 'json',
+                              levels: List[str] = None) -> Dict[str, Any]:
         """处理 SRT/ASS 字幕文件，生成每句的词汇释义与标签并写入 JSON。
 
-        返回生成的 JSON 数据（字典）。
+        Args:
+            subtitle_path: 字幕文件路径
+            out_json: 输出路径，默认为字幕同名的 -labels.json（'pack' 格式为 -labels.vlb）
+            fmt: 输出格式，'json' 为完整 JSON；'stream' 逐块写出，词典项按单词
+                 只保存一份、出现位置只记录句子序号（见 _write_stream）；
+                 'pack' 为列式二进制文件，可按时间窗口读取（见 labelpack）
+            levels: 额外要判断的词汇量等级列表，如 ['cet4', 'cet6', 'toefl']；
+                 一次分词和查词即可为每个单词给出 is_new_levels（等级 -> 是否超纲），
+                 并输出 statistics_by_level。is_new / new_words 仍按 user_vocab_level 计算
+
+        返回生成的 JSON 数据（字典）；'stream' / 'pack' 格式返回不含 blocks 的摘要。
         """
-        # 读取字幕并抽取每个字幕块的时间和文本
-        blocks = []  # each: dict(index, start, end, text)
-        if not os.path.exists(subtitle_path):
-            raise FileNotFoundError(subtitle_path)
-
-        with open(subtitle_path, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.isdigit():
-                index = int(line)
-                i += 1
-                if i >= len(lines):
-                    break
-                times = lines[i].strip()
-                start, end = ('', '')
-                m = re.match(r"(\d{2}:\d{2}:\d{2}[,\.]\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2}[,\.]\d{3})", times)
-                if m:
-                    start, end = m.group(1), m.group(2)
-                i += 1
-                text_lines = []
-                while i < len(lines) and lines[i].strip() != '':
-                    text_lines.append(lines[i].rstrip('\n'))
-                    i += 1
-                # 跳过空行
-                while i < len(lines) and lines[i].strip() == '':
-                    i += 1
-                text = ' '.join([t.strip() for t in text_lines])
-                blocks.append({'index': index, 'start': start, 'end': end, 'text': text})
-            else:
-                i += 1
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f'不支持的输出格式: {fmt}')
+        blocks = _read_blocks(subtitle_path)
+        tokens_list = [_tokenize(blk['text']) for blk in blocks]
+        entries, labels = self._label_words(tokens_list)
+        flags, level_stats = None, None
+        if levels:
+            levels = list(dict.fromkeys(level.lower().strip() for level in levels))
+            flags, level_stats = self._classify_levels(entries, labels, levels)
+
+        if not out_json:
+            base = subtitle_path[:subtitle_path.rfind('.')]
+            out_json = base + ('-labels' + labelpack.PACK_EXTENSION if fmt == 'pack' else '-labels.json')
+        if fmt == 'stream':
+            return self._write_stream(subtitle_path, out_json, blocks, tokens_list, entries, labels,
+                                      flags, level_stats)
+        if fmt == 'pack':
+            return self._write_pack(subtitle_path, out_json, blocks, entries, labels, flags, level_stats)
 
         # 对每个块中的单词进行查找
         label_blocks = []
         word_map = {}  # unique word -> entry
         new_words = []  # 生词列表（超出用户词汇量的单词）
+        new_word_keys = set()  # 已收入生词列表的小写单词，O(1) 判重
 
-        for blk in blocks:
-            text = blk['text']
-            tokens = _tokenize(text)
+        for blk, tokens in zip(blocks, tokens_list):
             words_info = []
             for tok in tokens:
                 key = tok
-                entry = self.lookup(tok)
-
-                # 判断是否超出用户词汇量
-                is_new_word = False
-                difficulty_label = ''
-                if self.level_checker is not None:
-                    is_new_word = self.level_checker.is_beyond_level(tok, entry)
-                    difficulty_label = self.level_checker.get_difficulty_label(tok, entry)
+                word_key = key.lower()
+                entry = entries[word_key]
+                is_new_word, difficulty_label = labels[word_key]
 
                 # 记录到 words_info，添加难度信息
                 word_info = {
@@ -194,10 +516,11 @@ class Labeler:
                     'is_new': is_new_word,  # 是否超纲
                     'difficulty': difficulty_label  # 难度标签
                 }
+                if flags is not None:
+                    word_info['is_new_levels'] = flags[word_key]
                 words_info.append(word_info)
 
                 # 确保每一个词在 word_map 中，并添加难度信息
-                word_key = key.lower()
                 if word_key not in word_map:
                     word_map[word_key] = {
                         'entry': entry,
@@ -205,6 +528,8 @@ class Labeler:
                         'difficulty': difficulty_label,
                         'occurrences': []  # 记录出现位置
                     }
+                    if flags is not None:
+                        word_map[word_key]['is_new_levels'] = flags[word_key]
                 # 记录该词在哪个句子中出现
                 word_map[word_key]['occurrences'].append({
                     'sentence_index': blk['index'],
@@ -212,17 +537,8 @@ class Labeler:
                 })
 
                 # 如果是生词，加入生词列表
-                if is_new_word and word_key not in [w['word'].lower() for w in new_words]:
-                    new_words.append({
-                        'word': entry.get('word') or tok,
-                        'translation': entry.get('translation', ''),
-                        'difficulty': difficulty_label,
-                        'first_occurrence': {
-                            'sentence_index': blk['index'],
-                            'sentence_text': blk['text'],
-                            'timestamp': f"{blk['start']} --> {blk['end']}"
-                        }
-                    })
+                if is_new_word:
+                    _add_new_word(new_words, new_word_keys, word_key, tok, entry, difficulty_label, blk)
 
             label_blocks.append({
                 'index': blk['index'],
@@ -238,43 +554,340 @@ class Labeler:
             'blocks': label_blocks,
             'word_map': word_map,
             'new_words': new_words,  # 生词列表
-            'statistics': {  # 统计信息
-                'total_words': len(word_map),
-                'new_words_count': len(new_words),
-                'coverage_rate': round((len(word_map) - len(new_words)) / len(word_map) * 100, 2) if len(word_map) > 0 else 0
-            }
+            'statistics': _statistics(len(word_map), len(new_words))  # 统计信息
         }
+        if levels:
+            result['levels'] = levels
+            result['statistics_by_level'] = level_stats
 
         # 输出 JSON
-        if not out_json:
-            base = subtitle_path[:subtitle_path.rfind('.')]
-            out_json = base + '-labels.json'
-        try:
-            with open(out_json, 'w', encoding='utf-8') as jf:
-                json.dump(result, jf, ensure_ascii=False, indent=2)
-        except Exception as e:
-            raise
+        with open(out_json, 'w', encoding='utf-8') as jf:
+            json.dump(result, jf, ensure_ascii=False, indent=2)
 
         return result
 
+    def _write_stream(self, subtitle_path: str, out_json: str, blocks: List[Dict[str, Any]],
+                      tokens_list: List[List[str]], entries: Dict[str, Any],
+                      labels: Dict[str, Tuple[bool, str]], flags: Dict[str, Dict[str, bool]] = None,
+                      level_stats: Dict[str, Any] = None) -> Dict[str, Any]:
+        """以 'stream' 格式逐块写出标注结果。
+
+        与完整 JSON 的区别：
+          - blocks 中每个词只有 original 和 key，释义与难度到 entries / word_map 中按 key 查
+          - entries 每个单词只保存一份词典项
+          - word_map 的 occurrences 与 new_words 的 first_occurrence 只记录句子序号，不复制原文
+        blocks / entries / word_map 都逐项序列化后立即写出，不在内存中构造整个结果；
+        写出过程中每个单词只保留一条记录，occurrences 用 uint32 数组（array('I')）存放，
+        返回的摘要中也是该数组。注意输入的字幕块、分词结果和 entries 由调用方构造，
+        本身仍随字幕长度增长，这里只保证输出阶段不再额外复制。
+        """
+        dumps = json.dumps
+        word_map = {}
+        new_words = []
+        new_word_keys = set()
+        with open(out_json, 'w', encoding='utf-8') as jf:
+            head = {
+                'format': 'stream',
+                'version': 2,
+                'source': os.path.basename(subtitle_path),
+                'path': os.path.abspath(subtitle_path),
+            }
+            if flags is not None:
+                head['levels'] = list(level_stats)
+            jf.write(dumps(head, ensure_ascii=False)[:-1] + ', "blocks": [')
+            for pos, (blk, tokens) in enumerate(zip(blocks, tokens_list)):
+                words_info = []
+                for tok in tokens:
+                    word_key = tok.lower()
+                    words_info.append({'original': tok, 'key': word_key})
+                    item = word_map.get(word_key)
+                    if item is None:
+                        is_new_word, difficulty_label = labels[word_key]
+                        item = word_map[word_key] = {
+                            'is_new': is_new_word,
+                            'difficulty': difficulty_label,
+                            'occurrences': array('I')
+                        }
+                        if flags is not None:
+                            item['is_new_levels'] = flags[word_key]
+                    item['occurrences'].append(blk['index'])
+                    if item['is_new']:
+                        _add_new_word(new_words, new_word_keys, word_key, tok, entries[word_key],
+                                      item['difficulty'], blk, compact=True)
+                block = {
+                    'index': blk['index'],
+                    'start': blk['start'],
+                    'end': blk['end'],
+                    'text': blk['text'],
+                    'words': words_info
+                }
+                jf.write((',\n' if pos else '\n') + dumps(block, ensure_ascii=False))
+            jf.write('\n],\n"entries": {')
+            for pos, word_key in enumerate(word_map):
+                jf.write((',\n' if pos else '\n') + dumps(word_key, ensure_ascii=False) + ': ')
+                jf.write(dumps(entries[word_key], ensure_ascii=False))
+            statistics = _statistics(len(word_map), len(new_words))
+            jf.write('\n},\n"word_map": {')
+            for pos, (word_key, item) in enumerate(word_map.items()):
+                jf.write((',\n' if pos else '\n') + dumps(word_key, ensure_ascii=False) + ': ')
+                jf.write(dumps(item, ensure_ascii=False, default=list))
+            jf.write('\n}')
+            jf.write(',\n"new_words": ' + dumps(new_words, ensure_ascii=False))
+            jf.write(',\n"statistics": ' + dumps(statistics, ensure_ascii=False))
+            if level_stats is not None:
+                jf.write(',\n"statistics_by_level": ' + dumps(level_stats, ensure_ascii=False))
+            jf.write('}\n')
+
+        summary = {
+            'source': os.path.basename(subtitle_path),
+            'path': os.path.abspath(subtitle_path),
+            'output': os.path.abspath(out_json),
+            'block_count': len(blocks),
+            'word_map': word_map,
+            'new_words': new_words,
+            'statistics': statistics
+        }
+        if level_stats is not None:
+            summary['statistics_by_level'] = level_stats
+        return summary
+
+    def _write_pack(self, subtitle_path: str, out_path: str, blocks: List[Dict[str, Any]],
+                    entries: Dict[str, Any], labels: Dict[str, Tuple[bool, str]],
+                    flags: Dict[str, Dict[str, bool]] = None, level_stats: Dict[str, Any] = None) -> Dict[str, Any]:
+        """以 'pack' 格式写出列式二进制标注文件，读取见 labelpack.LabelPack。
+
+        每个词只记录 (字幕块, 字符位置, 单词编号, 难度编号, 是否超纲)，
+        词典项按单词去重后单独存放。
+        """
+        builder = labelpack.PackBuilder()
+        word_map = {}
+        new_words = []
+        new_word_keys = set()
+        for blk in blocks:
+            builder.add_block(blk['index'], blk['start'], blk['end'], blk['text'])
+            for m in _TOKEN_RE.finditer(blk['text']):
+                tok = m.group()
+                word_key = tok.lower()
+                is_new_word, difficulty_label = labels[word_key]
+                word_id = builder.add_word(word_key, entries[word_key], is_new_word, difficulty_label,
+                                           flags[word_key] if flags is not None else None)
+                builder.add_token(m.start(), len(tok), word_id, difficulty_label, is_new_word)
+                item = word_map.get(word_key)
+                if item is None:
+                    item = word_map[word_key] = {
+                        'id': word_id,
+                        'is_new': is_new_word,
+                        'difficulty': difficulty_label,
+                        'occurrences': []
+                    }
+                    if flags is not None:
+                        item['is_new_levels'] = flags[word_key]
+                item['occurrences'].append(blk['index'])
+                if is_new_word:
+                    _add_new_word(new_words, new_word_keys, word_key, tok, entries[word_key],
+                                  difficulty_label, blk, compact=True)
+        statistics = _statistics(len(word_map), len(new_words))
+        meta = {
+            'source': os.path.basename(subtitle_path),
+            'path': os.path.abspath(subtitle_path),
+            'new_words': new_words,
+            'statistics': statistics
+        }
+        if level_stats is not None:
+            meta['levels'] = list(level_stats)
+            meta['statistics_by_level'] = level_stats
+        builder.save(out_path, meta)
+        summary = {
+            'source': meta['source'],
+            'path': meta['path'],
+            'output': os.path.abspath(out_path),
+            'block_count': len(blocks),
+            'word_map': word_map,
+            'new_words': new_words,
+            'statistics': statistics
+        }
+        if level_stats is not None:
+            summary['statistics_by_level'] = level_stats
+        return summary
+
+
+# 批量标注时识别的字幕扩展名
+SUBTITLE_EXTENSIONS = ('.srt',)
+
+# 每个工作进程持有一个 Labeler，词典通过共享实例 / mmap 只读共享
+_worker_labeler = None
+
+
+def is_dict_path(item: str) -> bool:
+    """旧用法的位置参数是否为词典：已存在的、stardict.open_dict 能打开的文件，
+    即 csv / txt / .ecdb，或者任意扩展名的 SQLite 数据库（按文件头判断）。"""
+    if not os.path.isfile(item):
+        return False
+    ext = os.path.splitext(item)[-1].lower()
+    if ext in COMPILED_DICT_EXTENSIONS:
+        return True
+    if ext in SUBTITLE_EXTENSIONS:
+        return False
+    try:
+        with open(item, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def expand_inputs(inputs: List[str], extensions: Tuple[str, ...] = SUBTITLE_EXTENSIONS) -> List[str]:
+    """把文件、目录（递归）和通配符展开为字幕文件列表，保持顺序并去重。"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            for root, dirs, names in os.walk(item):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(extensions) and not name.startswith('.'):
+                        found.append(os.path.join(root, name))
+            files.extend(found)
+        elif glob.has_magic(item):
+            files.extend(p for p in sorted(glob.glob(item, recursive=True))
+                         if os.path.isfile(p) and p.lower().endswith(extensions))
+        else:
+            files.append(item)
+    return list(dict.fromkeys(os.path.abspath(p) for p in files))
+
+
+def _init_worker(dict_csv_path: str, user_vocab_level: str):
+    global _worker_labeler
+    _worker_labeler = Labeler(dict_csv_path=dict_csv_path, user_vocab_level=user_vocab_level)
+
+
+def _label_one(subtitle_path: str, fmt: str, levels: List[str] = None) -> Dict[str, Any]:
+    """在工作进程中标注一个文件，返回耗时与词数，出错时记录 error 而不抛出。"""
+    result = {'path': subtitle_path, 'output': None, 'blocks': 0, 'tokens': 0,
+              'new_words': 0, 'seconds': 0.0, 'error': None}
+    t = time.perf_counter()
+    try:
+        data = _worker_labeler.process_subtitle_file(subtitle_path, fmt=fmt, levels=levels)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    else:
+        result['output'] = data.get('output') or subtitle_path[:subtitle_path.rfind('.')] + '-labels.json'
+        result['blocks'] = len(data['blocks']) if 'blocks' in data else data['block_count']
+        result['tokens'] = sum(len(item['occurrences']) for item in data['word_map'].values())
+        result['new_words'] = len(data['new_words'])
+    result['seconds'] = time.perf_counter() - t
+    return result
+
+
+def label_files(inputs: List[str], dict_csv_path: str = None, user_vocab_level: str = 'cet4',
+                fmt: str = 'json', jobs: int = None, levels: List[str] = None,
+                callback: Callable[[Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
+    """批量标注多个字幕文件，按输入顺序返回每个文件的结果。
+
+    Args:
+        inputs: 字幕文件、目录或通配符
+        jobs: 进程数，默认为 CPU 核数；为 1 时在当前进程内顺序处理
+        levels: 同时输出的多个词汇量等级，见 Labeler.process_subtitle_file
+        callback: 每完成一个文件调用一次，参数为该文件的结果
+
+    词典在主进程中先加载（必要时编译为 .ecdb），fork 出的工作进程直接继承
+    共享实例，其他启动方式下各进程 mmap 同一个编译文件，都不会重复解析 csv。
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'不支持的输出格式: {fmt}')
+    files = expand_inputs(inputs)
+    if not files:
+        return []
+    _init_worker(dict_csv_path, user_vocab_level)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files)))
+    results = {}
+    if jobs == 1:
+        for path in files:
+            results[path] = _label_one(path, fmt, levels)
+            if callback:
+                callback(results[path])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(dict_csv_path, user_vocab_level)) as executor:
+            futures = [executor.submit(_label_one, path, fmt, levels) for path in files]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['path']] = result
+                if callback:
+                    callback(result)
+    return [results[path] for path in files]
+
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('用法: python label.py <subtitle.srt> [ecdict.csv] [user_level]')
-        print('user_level 可选值: basic, cet4, cet6, toefl, ielts, gre, advanced (默认: cet4)')
-        sys.exit(1)
-    srt = sys.argv[1]
-    csvp = sys.argv[2] if len(sys.argv) > 2 else None
-    user_level = sys.argv[3] if len(sys.argv) > 3 else 'cet4'
-
-    lab = Labeler(dict_csv_path=csvp, user_vocab_level=user_level) if csvp else Labeler(user_vocab_level=user_level)
-    data = lab.process_subtitle_file(srt)
-
-    print(f'生成标签文件，包含 {len(data["blocks"])} 个字幕块，{len(data["word_map"])} 个单词')
+    import argparse
+    parser = argparse.ArgumentParser(description='为字幕文件生成词汇标注')
+    parser.add_argument('inputs', nargs='+', metavar='subtitle',
+                        help='字幕文件、目录或通配符；兼容旧用法 <subtitle.srt> [ecdict.csv] [user_level]')
+    parser.add_argument('-d', '--dict', default=None, help='ECDICT 词典 csv，默认为 ecdict.csv')
+    parser.add_argument('-l', '--level', default=None,
+                        help='basic, cet4, cet6, toefl, ielts, gre, advanced (默认: cet4)')
+    parser.add_argument('-f', '--format', default='json', choices=OUTPUT_FORMATS,
+                        help='输出格式 (默认: json)')
+    parser.add_argument('-o', '--output', default=None, help='输出文件路径（仅单个文件）')
+    parser.add_argument('-L', '--levels', default=None,
+                        help='同时输出多个等级的生词标记，逗号分隔，如 cet4,cet6,toefl')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='并行进程数 (默认: CPU 核数)')
+    args = parser.parse_args()
+
+    # 旧用法：第一个位置参数总是字幕，其后可以跟词典与词汇量等级
+    inputs = args.inputs[:1]
+    for item in args.inputs[1:]:
+        if item.lower() in ('basic', 'cet4', 'cet6', 'toefl', 'ielts', 'gre', 'advanced') and not os.path.exists(item):
+            args.level = args.level or item
+        elif is_dict_path(item):
+            if args.dict:
+                parser.error(f'指定了多个词典: {args.dict}, {item}')
+            args.dict = item
+        else:
+            inputs.append(item)
+    missing = [item for item in inputs if not glob.has_magic(item) and not os.path.exists(item)]
+    if missing:
+        parser.error(f'找不到字幕文件: {", ".join(missing)}')
+    if not expand_inputs(inputs):
+        parser.error('没有找到字幕文件')
+    user_level = args.level or 'cet4'
+    levels = [lv for lv in (args.levels or '').split(',') if lv.strip()] or None
+    single = len(inputs) == 1 and os.path.isfile(inputs[0])
+    if args.output and not single:
+        parser.error('-o/--output 只能用于单个字幕文件')
+
+    if not single:
+        def report(result):
+            name = os.path.basename(result['path'])
+            if result['error']:
+                print(f'  ✗ {name}: {result["error"]}')
+            else:
+                speed = result['tokens'] / result['seconds'] if result['seconds'] else 0.0
+                print(f'  ✓ {name}: {result["blocks"]} 块, {result["tokens"]} 词, '
+                      f'{result["new_words"]} 生词, {result["seconds"]:.2f}s ({speed:.0f} 词/秒)')
+
+        t = time.perf_counter()
+        results = label_files(inputs, args.dict, user_level, args.format, args.jobs, levels, report)
+        elapsed = time.perf_counter() - t
+        done = [r for r in results if not r['error']]
+        tokens = sum(r['tokens'] for r in done)
+        print(f'完成 {len(done)}/{len(results)} 个文件，共 {tokens} 词，'
+              f'耗时 {elapsed:.2f}s ({tokens / elapsed if elapsed else 0.0:.0f} 词/秒)')
+        sys.exit(0 if len(done) == len(results) else 1)
+
+    if args.dict:
+        lab = Labeler(dict_csv_path=args.dict, user_vocab_level=user_level)
+    else:
+        lab = Labeler(user_vocab_level=user_level)
+    data = lab.process_subtitle_file(inputs[0], args.output, fmt=args.format, levels=levels)
+
+    block_count = len(data['blocks']) if 'blocks' in data else data['block_count']
+    print(f'生成标签文件，包含 {block_count} 个字幕块，{len(data["word_map"])} 个单词')
     print(f'统计信息:')
     print(f'  - 总词汇数: {data["statistics"]["total_words"]}')
     print(f'  - 生词数: {data["statistics"]["new_words_count"]}')
     print(f'  - 词汇覆盖率: {data["statistics"]["coverage_rate"]}%')
+    for level, stat in data.get('statistics_by_level', {}).items():
+        print(f'  - {level}: 生词 {stat["new_words_count"]}，覆盖率 {stat["coverage_rate"]}%')
     print(f'\n前 10 个生词:')
     for i, word in enumerate(data["new_words"][:10], 1):
         print(f'  {i}. {word["word"]} ({word["difficulty"]}) - {word["translation"]}')
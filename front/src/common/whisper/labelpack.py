@@ -0,0 +1,286 @@
+"""
+紧凑的列式标注文件（.vlb）
+
+label.Labeler 的 JSON 输出会为每个词重复写出词典项，长视频的文件很大，
+前端却只需要按播放时间取出当前几句的高亮信息。这里把标注结果拆成若干列：
+
+    header   : magic, version, 块数, 词数, 单词数, 以及各段偏移（小端 uint32）
+    blocks   : start_ms[], end_ms[], max_end_ms[], index[], token_start[n + 1], text_off[n + 1]
+               （max_end_ms[i] = max(end_ms[0..i])，字幕块允许时间重叠）
+    texts    : 所有字幕块文本（utf-8）
+    tokens   : block[], offset[], length[], word_id[], difficulty[], flags[]
+    words    : entry_off[m + 1] + 每个单词一段 JSON（key, entry, is_new, difficulty[, is_new_levels]）
+    meta     : JSON（source, path, difficulties, new_words, statistics[, levels, statistics_by_level]）
+
+LabelPack 用 mmap 打开文件，按时间窗口二分定位字幕块，只解码用到的块和单词。
+
+单位约定：
+  - 文件中时间为毫秒；LabelPack.block / window 的 start、end 均为秒（float），
+    与 JSON 输出中的 SRT 时间串 '00:01:02,500' 表示同一时刻
+  - offset / length 以 Unicode 码点计（即 Python str 下标），而不是 utf-8 字节或
+    UTF-16 单元；JS 端按码点切分文本（Array.from(text)）后再用 offset 索引
+"""
+
+import array
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Any, Dict, List
+
+PACK_MAGIC = b'VLLB'
+PACK_VERSION = 3
+PACK_EXTENSION = '.vlb'
+PACK_HEADER = struct.Struct('<4sIIIIIIIIII')
+
+# tokens.flags 的位
+FLAG_NEW = 1
+
+
+def parse_timestamp(text: str) -> int:
+    """把 SRT 时间 '00:01:02,500' 转为毫秒，无法解析时返回 0。"""
+    m = re.match(r"(\d+):(\d{2}):(\d{2})[,\.](\d{3})", text or '')
+    if not m:
+        return 0
+    h, mi, s, ms = (int(n) for n in m.groups())
+    return ((h * 60 + mi) * 60 + s) * 1000 + ms
+
+
+def _pack_array(typecode: str, values) -> bytes:
+    data = array.array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+class PackBuilder:
+    """逐块收集标注结果，最后一次性写出 .vlb 文件"""
+
+    def __init__(self):
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+        self.indices = array.array('I')
+        self.token_start = array.array('I', [0])
+        self.text_off = array.array('I', [0])
+        self.texts = []
+        self.text_size = 0
+        self.tok_block = array.array('I')
+        self.tok_offset = array.array('I')
+        self.tok_length = array.array('I')
+        self.tok_word = array.array('I')
+        self.tok_difficulty = array.array('B')
+        self.tok_flags = array.array('B')
+        self.words = []
+        self.word_ids = {}
+        self.difficulties = []
+        self.difficulty_codes = {}
+
+    def difficulty_code(self, label: str) -> int:
+        """难度标签 -> 编号"""
+        code = self.difficulty_codes.get(label)
+        if code is None:
+            code = self.difficulty_codes[label] = len(self.difficulties)
+            self.difficulties.append(label)
+        return code
+
+    def add_word(self, key: str, entry: Dict[str, Any], is_new: bool, difficulty: str,
+                 is_new_levels: Dict[str, bool] = None) -> int:
+        """登记一个单词（同一 key 只保存一次），返回单词编号。"""
+        word_id = self.word_ids.get(key)
+        if word_id is None:
+            word_id = self.word_ids[key] = len(self.words)
+            info = {
+                'key': key,
+                'entry': entry,
+                'is_new': is_new,
+                'difficulty': difficulty
+            }
+            if is_new_levels is not None:
+                info['is_new_levels'] = is_new_levels
+            self.words.append(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+        return word_id
+
+    def add_block(self, index: int, start: str, end: str, text: str):
+        """开始一个字幕块，随后用 add_token 添加该块的词。"""
+        if self.texts:
+            self.token_start.append(len(self.tok_word))
+        self.starts.append(parse_timestamp(start))
+        self.ends.append(parse_timestamp(end))
+        self.indices.append(index)
+        data = text.encode('utf-8')
+        self.texts.append(data)
+        self.text_size += len(data)
+        self.text_off.append(self.text_size)
+
+    def add_token(self, offset: int, length: int, word_id: int, difficulty: str, is_new: bool):
+        """给当前字幕块添加一个词，offset/length 为词在块文本中的字符位置。"""
+        self.tok_block.append(len(self.texts) - 1)
+        self.tok_offset.append(offset)
+        self.tok_length.append(length)
+        self.tok_word.append(word_id)
+        self.tok_difficulty.append(self.difficulty_code(difficulty))
+        self.tok_flags.append(FLAG_NEW if is_new else 0)
+
+    def save(self, filename: str, meta: Dict[str, Any]) -> int:
+        """写出文件，返回文件大小。"""
+        if self.texts:
+            self.token_start.append(len(self.tok_word))
+        meta = dict(meta, difficulties=self.difficulties)
+        max_end = array.array('I')
+        for end in self.ends:
+            max_end.append(max(end, max_end[-1]) if max_end else end)
+        entry_off = [0]
+        for data in self.words:
+            entry_off.append(entry_off[-1] + len(data))
+        sections = [
+            _pack_array('I', self.starts) + _pack_array('I', self.ends) +
+            _pack_array('I', max_end) + _pack_array('I', self.indices) + _pack_array('I', self.token_start) +
+            _pack_array('I', self.text_off),
+            b''.join(self.texts),
+            _pack_array('I', self.tok_block) + _pack_array('I', self.tok_offset) +
+            _pack_array('I', self.tok_length) + _pack_array('I', self.tok_word) +
+            _pack_array('B', self.tok_difficulty) + _pack_array('B', self.tok_flags),
+            _pack_array('I', entry_off) + b''.join(self.words),
+            json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+        ]
+        offsets = []
+        pos = PACK_HEADER.size
+        for section in sections:
+            offsets.append(pos)
+            pos += len(section)
+        if self.texts:
+            self.token_start.pop()
+        head = PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(self.texts),
+                                len(self.tok_word), len(self.words), *offsets, pos)
+        with open(filename, 'wb') as fp:
+            fp.write(head)
+            for section in sections:
+                fp.write(section)
+        return pos
+
+
+class LabelPack:
+    """只读打开 .vlb 文件，按需解码字幕块与单词"""
+
+    def __init__(self, filename: str):
+        self.filename = os.path.abspath(filename)
+        self._fp = open(self.filename, 'rb')
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fp.close()
+            raise ValueError(f'标注文件为空: {self.filename}')
+        head = PACK_HEADER.unpack(self._mm[:PACK_HEADER.size])
+        if head[0] != PACK_MAGIC or head[1] != PACK_VERSION:
+            self.close()
+            raise ValueError(f'不是有效的标注文件: {self.filename}')
+        n, t, m = head[2], head[3], head[4]
+        blocks, self._texts, tokens, words, meta, size = head[5:]
+        self.block_count, self.token_count, self.word_count = n, t, m
+        self.starts = self._column('I', blocks, n)
+        self.ends = self._column('I', blocks + n * 4, n)
+        self.max_end = self._column('I', blocks + n * 8, n)
+        self.indices = self._column('I', blocks + n * 12, n)
+        self.token_start = self._column('I', blocks + n * 16, n + 1)
+        self.text_off = self._column('I', blocks + n * 20 + 4, n + 1)
+        self.tok_block = self._column('I', tokens, t)
+        self.tok_offset = self._column('I', tokens + t * 4, t)
+        self.tok_length = self._column('I', tokens + t * 8, t)
+        self.tok_word = self._column('I', tokens + t * 12, t)
+        self.tok_difficulty = self._column('B', tokens + t * 16, t)
+        self.tok_flags = self._column('B', tokens + t * 17, t)
+        self._entry_off = self._column('I', words, m + 1)
+        self._entries = words + (m + 1) * 4
+        self.meta = json.loads(self._mm[meta:size].decode('utf-8'))
+        self.difficulties = self.meta.get('difficulties', [])
+        self._word_cache = {}
+
+    def _column(self, typecode: str, offset: int, size: int):
+        """映射一列定长整数，大端平台上退化为拷贝"""
+        width = array.array(typecode).itemsize
+        if sys.byteorder == 'little':
+            return memoryview(self._mm)[offset:offset + size * width].cast(typecode)
+        data = array.array(typecode)
+        data.frombytes(self._mm[offset:offset + size * width])
+        data.byteswap()
+        return data
+
+    def close(self):
+        for name in ('starts', 'ends', 'max_end', 'indices', 'token_start', 'text_off', 'tok_block',
+                     'tok_offset', 'tok_length', 'tok_word', 'tok_difficulty', 'tok_flags',
+                     '_entry_off'):
+            setattr(self, name, None)
+        if getattr(self, '_mm', None) is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+            self._mm = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.block_count
+
+    def word(self, word_id: int) -> Dict[str, Any]:
+        """按编号取单词信息（key, entry, is_new, difficulty）"""
+        data = self._word_cache.get(word_id)
+        if data is None:
+            start = self._entries + self._entry_off[word_id]
+            end = self._entries + self._entry_off[word_id + 1]
+            data = self._word_cache[word_id] = json.loads(self._mm[start:end].decode('utf-8'))
+        return data
+
+    def text(self, pos: int) -> str:
+        start = self._texts + self.text_off[pos]
+        return self._mm[start:self._texts + self.text_off[pos + 1]].decode('utf-8')
+
+    def block(self, pos: int, entries: bool = False) -> Dict[str, Any]:
+        """解码第 pos 个字幕块；entries 为 True 时每个词附带词典项。
+
+        start / end 为秒，offset 为词在 text 中的码点位置（见模块说明）。
+        """
+        text = self.text(pos)
+        words = []
+        for t in range(self.token_start[pos], self.token_start[pos + 1]):
+            offset = self.tok_offset[t]
+            word_id = self.tok_word[t]
+            info = {
+                'original': text[offset:offset + self.tok_length[t]],
+                'offset': offset,
+                'word_id': word_id,
+                'is_new': bool(self.tok_flags[t] & FLAG_NEW),
+                'difficulty': self.difficulties[self.tok_difficulty[t]],
+            }
+            if entries:
+                info['entry'] = self.word(word_id)['entry']
+            words.append(info)
+        return {
+            'index': self.indices[pos],
+            'start': self.starts[pos] / 1000.0,
+            'end': self.ends[pos] / 1000.0,
+            'text': text,
+            'words': words
+        }
+
+    def window(self, start: float, end: float, entries: bool = False) -> List[Dict[str, Any]]:
+        """取出与时间窗口 [start, end)（秒）重叠的字幕块，字幕块需按开始时间排序。
+
+        max_end 单调不减，lo 之前的块都在 start 之前结束，因此时间较长、
+        与后面多个块重叠的字幕块也不会漏掉。
+        """
+        start_ms = int(start * 1000)
+        end_ms = int(end * 1000)
+        hi = bisect.bisect_left(self.starts, end_ms)
+        lo = bisect.bisect_right(self.max_end, start_ms, 0, hi)
+        return [self.block(pos, entries) for pos in range(lo, hi) if self.ends[pos] > start_ms]
@@ -0,0 +1,89 @@
+"""
+dictutils 辨析数据测试
+"""
+
+import os
+import shutil
+import tempfile
+
+import dictutils
+import stardict
+
+MINI_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ecdict.mini.csv')
+RESEMBLE_TXT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resemble.txt')
+
+
+def test_resemble_cached():
+    """测试辨析数据的编译缓存与按需生成 HTML"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        txtname = os.path.join(tmpdir, 'resemble.txt')
+        shutil.copy(RESEMBLE_TXT, txtname)
+
+        plain = dictutils.Resemble()
+        plain.load(txtname)
+
+        first = dictutils.Resemble()
+        assert first.load_cached(txtname)
+        assert os.path.exists(os.path.join(tmpdir, 'resemble.rsdb'))
+
+        second = dictutils.Resemble()
+        assert second.load_cached(txtname)
+        assert second._resembles == plain._resembles
+        assert second._words == plain._words
+
+        # 一个分组里重复出现的词只引用一次
+        for word, ids in plain._words.items():
+            assert len(set(ids)) == len(ids)
+
+        # 摘要不符时重新解析
+        with open(txtname, 'a') as fp:
+            fp.write('\n')
+        third = dictutils.Resemble()
+        assert third.load_cached(txtname)
+        assert third._resembles == plain._resembles
+
+        mapping = second.compile_map()
+        assert mapping == plain.compile_map()
+        assert mapping['quite'] is second.html('quite')
+        assert second.html('Quite') == mapping['quite']
+        assert second.groups('QUITE') == plain.groups('quite')
+        assert second.html('no-such-word') is None
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print("  ✓ 辨析数据缓存与 HTML 生成正确")
+
+
+def test_render_parallel():
+    """测试多进程分块渲染与顺序渲染的输出完全一致"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = stardict.DictCsv(MINI_CSV)
+        words = [ word for _, word in db ]
+        generator = dictutils.Generator()
+        render = generator.render_stardict
+        expected = [ (word, render(word, db[word])) for word in words ]
+        assert list(dictutils.render_ordered(render, db, words, 1, 7)) == expected
+        assert list(dictutils.render_ordered(render, db, words, 3, 7)) == expected
+        assert list(dictutils.render_ordered(render, db, ['no-such-word'], 1)) == [('no-such-word', None)]
+
+        outputs = []
+        for jobs in (1, 3):
+            name = os.path.join(tmpdir, 'mdx%d.txt' % jobs)
+            assert generator.compile_mdx(db, name, style=True, jobs=jobs, chunk=7) == len(db)
+            with open(name, 'rb') as fp:
+                outputs.append(fp.read())
+            generator.compile_stardict(db, os.path.join(tmpdir, 'sd%d.ifo' % jobs), 'mini', jobs, 7)
+            with open(os.path.join(tmpdir, 'sd%d.dict' % jobs), 'rb') as fp:
+                outputs.append(fp.read())
+        assert outputs[0] == outputs[2] and outputs[1] == outputs[3]
+        assert outputs[0].count(b'</>') == len(db)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print("  ✓ 多进程渲染输出与顺序渲染一致")
+
+
+if __name__ == '__main__':
+    test_resemble_cached()
+    test_render_parallel()
+    print("✅ 所有测试完成")
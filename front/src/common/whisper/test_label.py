@@ -0,0 +1,509 @@
+"""
+字幕词汇标注测试
+"""
+
+import itertools
+import json
+import os
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+
+import label
+import labelpack
+import stardict
+import vocab_level
+
+MINI_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ecdict.mini.csv')
+
+
+def _temp_dict():
+    """把迷你词典复制到临时目录，返回 (目录, csv 路径)"""
+    tmpdir = tempfile.mkdtemp()
+    csvname = os.path.join(tmpdir, 'ecdict.csv')
+    shutil.copy(MINI_CSV, csvname)
+    return tmpdir, csvname
+
+
+def _write_srt(path, sentences):
+    """按句子列表生成 SRT 字幕文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, text in enumerate(sentences, 1):
+            f.write(f"{i}\n00:00:{i % 60:02d},000 --> 00:00:{i % 60:02d},500\n{text}\n\n")
+
+
+class _CountingDict:
+    """统计 query / query_batch 调用次数的词典包装"""
+
+    def __init__(self, db):
+        self.db = db
+        self.batches = 0
+        self.probes = 0
+
+    def query(self, key):
+        self.probes += 1
+        return self.db.query(key)
+
+    def query_batch(self, keys):
+        self.batches += 1
+        self.probes += len(keys)
+        return self.db.query_batch(keys)
+
+
+def test_shared_dict():
+    """测试多个 Labeler 共享同一个词典实例"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        first = label.Labeler(dict_csv_path=csvname)
+        second = label.Labeler(dict_csv_path=csvname, user_vocab_level='gre')
+        assert first._dict is second._dict
+
+        # 文件更新后自动重新加载
+        stamp = os.path.getmtime(csvname) + 10
+        os.utime(csvname, (stamp, stamp))
+        third = label.Labeler(dict_csv_path=csvname)
+        assert third._dict is not first._dict
+
+        # 显式失效
+        assert label.invalidate_shared_dict(csvname) == 1
+        fourth = label.Labeler(dict_csv_path=csvname)
+        assert fourth._dict is not third._dict
+        print("  ✓ 词典实例在 Labeler 之间共享")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_profile_cache_bounded():
+    """测试共享的分级缓存有容量上限，淘汰后结果不变"""
+    tmpdir, csvname = _temp_dict()
+    size = label.PROFILE_CACHE_SIZE
+    try:
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Hello, 'hood!", "The gate of the 'hood.", "Inconsecutively yours", "The end"])
+        lab = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        expected = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'full.json'))
+        label.invalidate_shared_dict()
+
+        label.PROFILE_CACHE_SIZE = 2
+        lab = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        assert lab.process_subtitle_file(srt, os.path.join(tmpdir, 'small.json')) == expected
+        assert lab.process_subtitle_file(srt, os.path.join(tmpdir, 'small.json')) == expected
+        assert lab.checker('toefl').profiles is lab.level_checker.profiles
+        assert 0 < len(lab.level_checker.profiles) <= 2
+        print("  ✓ 分级缓存不超过容量上限")
+    finally:
+        label.PROFILE_CACHE_SIZE = size
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_batched_lookup():
+    """测试每个不同单词只查找一次"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Hello the hood, the HOOD and 'hood."] * 200)
+        lab = label.Labeler(dict_csv_path=csvname)
+        counter = _CountingDict(lab._dict)
+        lab._dict = counter
+        data = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'demo.json'))
+
+        # hello, the, hood, and, 'hood 五个不同单词，最多五轮候选
+        assert counter.batches <= 5
+        assert counter.probes <= 5 * 5
+        assert data['word_map']["'hood"]['entry']['translation'].startswith('n. 罩')
+        assert data['word_map']['hood']['entry']['translation'] == ''
+        assert len(data['word_map']['the']['occurrences']) == 400
+        print(f"  ✓ {counter.batches} 次批量查询，共 {counter.probes} 个候选")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_stream_output():
+    """测试 stream 格式与完整 JSON 内容一致"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Hello, 'hood!", "The gate of the 'hood.", "Inconsecutively yours"])
+        lab = label.Labeler(dict_csv_path=csvname)
+        full = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'full.json'))
+        summary = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'stream.json'), fmt='stream')
+        with open(summary['output'], encoding='utf-8') as f:
+            stream = json.load(f)
+
+        assert summary['block_count'] == len(full['blocks'])
+        assert stream['statistics'] == full['statistics']
+        for fb, sb in zip(full['blocks'], stream['blocks']):
+            assert sb['text'] == fb['text']
+            for fw, sw in zip(fb['words'], sb['words']):
+                assert sw['original'] == fw['original']
+                assert stream['entries'][sw['key']] == fw['entry']
+                assert stream['word_map'][sw['key']]['is_new'] == fw['is_new']
+        for key, item in full['word_map'].items():
+            occurrences = [o['sentence_index'] for o in item['occurrences']]
+            assert stream['word_map'][key]['occurrences'] == occurrences
+            assert summary['word_map'][key]['occurrences'].tolist() == occurrences
+        assert [w['word'] for w in stream['new_words']] == [w['word'] for w in full['new_words']]
+        print("  ✓ stream 格式内容与完整 JSON 一致")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_pack_output():
+    """测试 pack 格式可按时间窗口读取，内容与完整 JSON 一致"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Hello, 'hood!", "The gate of the 'hood.", "Inconsecutively yours", "The end"])
+        lab = label.Labeler(dict_csv_path=csvname)
+        full = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'full.json'))
+        summary = lab.process_subtitle_file(srt, fmt='pack')
+        assert summary['output'].endswith('-labels' + labelpack.PACK_EXTENSION)
+
+        with labelpack.LabelPack(summary['output']) as pack:
+            assert len(pack) == len(full['blocks'])
+            assert pack.meta['statistics'] == full['statistics']
+            for pos, fb in enumerate(full['blocks']):
+                pb = pack.block(pos, entries=True)
+                assert pb['index'] == fb['index'] and pb['text'] == fb['text']
+                for fw, pw in zip(fb['words'], pb['words']):
+                    assert pw['original'] == fw['original']
+                    assert pw['entry'] == fw['entry']
+                    assert (pw['is_new'], pw['difficulty']) == (fw['is_new'], fw['difficulty'])
+            # 第 2、3 块分别位于 2.0~2.5s、3.0~3.5s
+            assert [b['index'] for b in pack.window(2.2, 3.1)] == [2, 3]
+            assert [b['index'] for b in pack.window(2.5, 3.0)] == []
+            assert [b['index'] for b in pack.window(0, 100)] == [1, 2, 3, 4]
+
+        # 超过 64 KiB 的字幕块中偏移不被截断
+        text = 'x ' * 40000 + 'paradigm'
+        builder = labelpack.PackBuilder()
+        word_id = builder.add_word('paradigm', {'word': 'paradigm'}, True, 'GRE词汇')
+        builder.add_block(1, '00:00:01,000', '00:00:02,000', text)
+        builder.add_token(80000, 8, word_id, 'GRE词汇', True)
+        packname = os.path.join(tmpdir, 'long' + labelpack.PACK_EXTENSION)
+        builder.save(packname, {})
+        with labelpack.LabelPack(packname) as pack:
+            assert pack.block(0)['words'][0]['original'] == 'paradigm'
+
+        # 时间较长的字幕块与后面多个块重叠时，窗口内仍能取到
+        builder = labelpack.PackBuilder()
+        builder.add_block(1, '00:00:00,000', '00:00:10,000', 'Narrator')
+        builder.add_block(2, '00:00:01,000', '00:00:02,000', 'The gate')
+        builder.add_block(3, '00:00:03,000', '00:00:04,000', 'The end')
+        builder.add_block(4, '00:00:05,000', '00:00:06,000', 'Hello')
+        packname = os.path.join(tmpdir, 'overlap' + labelpack.PACK_EXTENSION)
+        builder.save(packname, {})
+        with labelpack.LabelPack(packname) as pack:
+            assert [b['index'] for b in pack.window(5.5, 5.8)] == [1, 4]
+            assert [b['index'] for b in pack.window(4.2, 4.5)] == [1]
+            assert [b['index'] for b in pack.window(10.0, 11.0)] == []
+            assert pack.block(3)['start'] == 5.0
+        print("  ✓ pack 格式内容与完整 JSON 一致，可按时间窗口读取")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_label_files_parallel():
+    """测试批量标注：目录展开、多进程结果与单进程一致、单个文件出错不影响其他文件"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        season = os.path.join(tmpdir, 'season')
+        os.makedirs(os.path.join(season, 'extra'))
+        for i in range(4):
+            _write_srt(os.path.join(season, f'e{i}.srt'), ["Hello, 'hood!", f"The gate {i}."] * (i + 1))
+        _write_srt(os.path.join(season, 'extra', 'bonus.srt'), ["The end"])
+        with open(os.path.join(season, 'notes.txt'), 'w') as f:
+            f.write('not a subtitle')
+
+        files = label.expand_inputs([season, os.path.join(season, 'e*.srt')])
+        assert [os.path.basename(p) for p in files] == ['e0.srt', 'e1.srt', 'e2.srt', 'e3.srt', 'bonus.srt']
+
+        serial = label.label_files([season], csvname, fmt='stream', jobs=1)
+        finished = []
+        parallel = label.label_files([season, os.path.join(tmpdir, 'missing.srt')], csvname,
+                                     fmt='stream', jobs=2, callback=finished.append)
+        assert len(finished) == len(parallel) == 6
+        assert parallel[-1]['error'] and not any(r['error'] for r in parallel[:-1])
+        for a, b in zip(serial, parallel):
+            assert (a['path'], a['blocks'], a['tokens'], a['new_words']) == \
+                   (b['path'], b['blocks'], b['tokens'], b['new_words'])
+        assert serial[3]['tokens'] == 4 * (2 + 2)
+        print(f"  ✓ 批量标注 {len(parallel)} 个文件")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_multi_level():
+    """测试一次处理输出多个等级的生词标记，与分别按等级处理的结果一致"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        dc = stardict.DictCsv(csvname)
+        dc.register('abandon', {'translation': 'v. 放弃', 'tag': 'cet4 cet6', 'bnc': 3500}, False)
+        dc.register('paradigm', {'translation': 'n. 范例', 'tag': 'gre', 'bnc': 15000}, False)
+        dc.register('essay', {'translation': 'n. 文章', 'tag': 'ielts', 'bnc': 4000}, False)
+        dc.commit()
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Abandon the paradigm", "An essay on the 'hood", "abandon hope"])
+
+        levels = ['cet4', 'cet6', 'toefl', 'gre']
+        lab = label.Labeler(dict_csv_path=csvname)
+        multi = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'multi.json'), levels=levels)
+        stream = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'multi.stream.json'),
+                                           fmt='stream', levels=levels)
+        assert multi['levels'] == levels
+        for level in levels:
+            single = label.Labeler(dict_csv_path=csvname, user_vocab_level=level)
+            data = single.process_subtitle_file(srt, os.path.join(tmpdir, f'{level}.json'))
+            for key, item in data['word_map'].items():
+                assert multi['word_map'][key]['is_new_levels'][level] == item['is_new'], (level, key)
+                assert stream['word_map'][key]['is_new_levels'][level] == item['is_new']
+            assert multi['statistics_by_level'][level] == data['statistics']
+            assert stream['statistics_by_level'][level] == data['statistics']
+        assert multi['word_map']['abandon']['is_new_levels'] == \
+            {'cet4': True, 'cet6': False, 'toefl': False, 'gre': False}
+        assert multi['blocks'][0]['words'][0]['is_new_levels']['cet4'] is True
+
+        try:
+            lab.process_subtitle_file(srt, os.path.join(tmpdir, 'bad.json'), levels=['cet5'])
+        except ValueError:
+            pass
+        else:
+            assert False, '未知等级应报错'
+        print("  ✓ 多等级标注与逐级标注结果一致")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_lemma_lookup():
+    """测试通过词形还原找到屈折变化的词根"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        dc = stardict.DictCsv(csvname)
+        for word in ('go', 'study', 'run', 'leave'):
+            dc.register(word, {'translation': f'v. {word}'}, False)
+        dc.commit()
+        lemma = os.path.join(tmpdir, 'lemma.txt')
+        with open(lemma, 'w', encoding='utf-8') as f:
+            f.write("; test lemma\ngo/100 -> goes,went,gone,going\nstudy -> studies,studied\n")
+            f.write("run -> running,ran\nleave -> leaves,left\nleaf -> leaves\n")
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["He went running", "She studies and leaves", "Went"])
+
+        lab = label.Labeler(dict_csv_path=csvname, lemma_path=lemma)
+        counter = _CountingDict(lab._dict)
+        lab._dict = counter
+        data = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'lemma.json'))
+        expected = {'went': 'go', 'running': 'run', 'studies': 'study', 'leaves': 'leave'}
+        for key, stem in expected.items():
+            assert data['word_map'][key]['entry']['word'] == stem, key
+            assert data['word_map'][key]['entry']['translation'] == f'v. {stem}'
+        # 原词一轮、词根一轮即全部命中（he / she / and 不在迷你词典中）
+        assert counter.batches <= 5
+
+        plain = label.Labeler(dict_csv_path=csvname, use_lemma=False)
+        data = plain.process_subtitle_file(srt, os.path.join(tmpdir, 'plain.json'))
+        assert data['word_map']['went']['entry']['translation'] == ''
+        assert data['word_map']['running']['entry']['translation'] == ''
+        print("  ✓ 词形还原命中 went / running / studies / leaves")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_levels_sidecar():
+    """测试词典旁有分级数组时，分级信息按 id 取数且结果不变"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        dc = stardict.DictCsv(csvname)
+        dc.register('abandon', {'translation': 'v. 放弃', 'tag': 'cet4 cet6', 'bnc': 3500}, False)
+        dc.register('paradigm', {'translation': 'n. 范例', 'tag': 'gre', 'bnc': 15000}, False)
+        dc.commit()
+        srt = os.path.join(tmpdir, 'demo.srt')
+        _write_srt(srt, ["Abandon the paradigm", "The gate of the 'hood", "abandon hope"])
+
+        plain = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        assert plain._levels is None
+        expected = plain.process_subtitle_file(srt, os.path.join(tmpdir, 'plain.json'))
+        label.invalidate_shared_dict()
+
+        stardict.compile_levels(csvname)
+        lab = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        assert lab._levels is not None
+        data = lab.process_subtitle_file(srt, os.path.join(tmpdir, 'levels.json'))
+        assert data == expected
+        assert lab.level_checker.profiles['paradigm'] == (vocab_level.tag_mask('gre'), 15000)
+        assert lab.level_checker.profiles["'hood"] == (0, 99999)
+        label.invalidate_shared_dict()
+
+        # 大写标签与逐词解析一致
+        dc = stardict.DictCsv(csvname)
+        dc.update('paradigm', {'tag': 'GRE'}, False)
+        dc.update('abandon', {'tag': 'CET4 CET6'}, False)
+        dc.commit()
+        plain = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        plain._levels = None
+        expected = plain.process_subtitle_file(srt, os.path.join(tmpdir, 'plain.json'))
+        label.invalidate_shared_dict()
+        stardict.compile_levels(csvname)
+        lab = label.Labeler(dict_csv_path=csvname, user_vocab_level='cet6')
+        assert lab._levels is not None
+        assert lab.process_subtitle_file(srt, os.path.join(tmpdir, 'levels.json')) == expected
+        assert lab.level_checker.profiles['paradigm'] == (vocab_level.tag_mask('gre'), 15000)
+
+        # 无法解析的 bnc 与逐词解析一样记为 BNC_INVALID（sqlite 词典保留原始值）
+        db = stardict.StarDict(os.path.join(tmpdir, 'levels.db'))
+        db.register_many([('Zygote', {'tag': 'GRE', 'bnc': 'n/a'}), ('zero', {'bnc': 0}),
+                          ('quay', {'tag': 'Cet4', 'bnc': '4200'}), ('quiz', {'bnc': None}),
+                          ('odd', {'bnc': 'n/a'})])
+        levels = stardict.DictLevels()
+        levels.build(db)
+        entries = [ db.query(word) for _, word in db ]
+        ids = [ entry['id'] for entry in entries ]
+        masks = label._level_masks()
+        checker = vocab_level.VocabLevelChecker(vocab_level.VocabLevel.CET6, profiles={})
+        checker.load_profiles([ entry['word'] for entry in entries ],
+                              [ masks[bits] for bits in levels.take('level', ids) ],
+                              levels.take('bnc', ids), stardict.LEVEL_BNC_INVALID)
+        for entry in entries:
+            assert checker.profiles[entry['word']] == vocab_level.word_profile(entry), entry
+        assert vocab_level.profile_label(checker.profiles['Zygote']) == 'GRE词汇'
+        assert vocab_level.profile_label(checker.profiles['odd']) == '未分级'
+        assert checker.profiles['zero'] == (0, 99999)
+        db.close()
+        print("  ✓ 分级数组结果与逐词解析一致")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_cli_arguments():
+    """测试命令行旧用法：第一个参数总是字幕，其后已存在的词典文件按词典处理，
+    缺少字幕、词典重复、多个输入时指定 -o 都报错"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        srt = os.path.join(tmpdir, 'a.srt')
+        _write_srt(srt, ["The gate of the 'hood"])
+        ass = os.path.join(tmpdir, 'x.ass')
+        _write_srt(ass, ["The end of the gate"])
+        dbname = os.path.join(tmpdir, 'ecdict.sqlite3')
+        assert stardict.convert_dict(dbname, csvname)
+        fake = os.path.join(tmpdir, 'notes.db')
+        with open(fake, 'w') as f:
+            f.write('not a database')
+        for item in (csvname, dbname):
+            assert label.is_dict_path(item), item
+        for item in (srt, ass, fake, tmpdir, os.path.join(tmpdir, '*.srt'), os.path.join(tmpdir, 'missing.csv')):
+            assert not label.is_dict_path(item), item
+
+        script = os.path.abspath(label.__file__)
+
+        def cli(*argv):
+            return subprocess.run([sys.executable, script] + list(argv), capture_output=True, text=True)
+
+        run = cli(srt, dbname, 'gre')
+        assert run.returncode == 0, run.stderr
+        with open(os.path.join(tmpdir, 'a-labels.json'), encoding='utf-8') as f:
+            data = json.load(f)
+        expected = label.Labeler(dict_csv_path=csvname, user_vocab_level='gre').process_subtitle_file(srt)
+        assert data['word_map'] == expected['word_map']
+
+        # 第一个参数即使不是 .srt 也按字幕处理
+        run = cli(ass, csvname)
+        assert run.returncode == 0, run.stderr
+        assert os.path.exists(os.path.join(tmpdir, 'x-labels.json'))
+
+        # 字幕不存在（如扩展名拼错）时报错，而不是当作词典后什么也不做
+        run = cli(os.path.join(tmpdir, 'ep1.str'), csvname)
+        assert run.returncode == 2 and '找不到字幕文件' in run.stderr
+        run = cli(srt, os.path.join(tmpdir, 'b.vtt'), csvname)
+        assert run.returncode == 2 and 'b.vtt' in run.stderr
+        run = cli(srt, csvname, dbname)
+        assert run.returncode == 2 and '多个词典' in run.stderr
+
+        _write_srt(os.path.join(tmpdir, 'b.srt'), ["The end"])
+        run = cli(srt, os.path.join(tmpdir, 'b.srt'), csvname, '-o', os.path.join(tmpdir, 'x.json'))
+        assert run.returncode == 2 and '-o' in run.stderr
+        assert not os.path.exists(os.path.join(tmpdir, 'x.json'))
+        print("  ✓ 命令行参数解析正确")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _synthetic_srt(path, tokens, vocab):
+    """生成 tokens 个词、vocab 个不同生词的合成字幕（每块 10 个词）"""
+    letters = itertools.product(string.ascii_lowercase, repeat=4)
+    words = ['q' + ''.join(t) for t in itertools.islice(letters, vocab)]
+    sentences = []
+    for b in range(tokens // 10):
+        sentences.append(' '.join(words[(b * 10 + k) % vocab] for k in range(10)))
+    _write_srt(path, sentences)
+
+
+def _count_lines(fn) -> int:
+    """统计 fn 执行期间 label.py 中执行的代码行数：与机器负载无关的操作数"""
+    count = [0]
+
+    def local(frame, event, arg):
+        if event == 'line':
+            count[0] += 1
+        return local
+
+    def tracer(frame, event, arg):
+        return local if os.path.basename(frame.f_code.co_filename) == 'label.py' else None
+
+    sys.settrace(tracer)
+    try:
+        fn()
+    finally:
+        sys.settrace(None)
+    return count[0]
+
+
+def test_new_words_linear_scaling():
+    """测试生词统计随词数线性增长：按执行的代码行数而非耗时比较"""
+    tmpdir, csvname = _temp_dict()
+    try:
+        lab = label.Labeler(dict_csv_path=csvname)
+        # 完整 JSON 由纯 Python 的 json 编码器写出，跟踪开销太大，这里用 stream / pack 格式，
+        # 它们与 JSON 格式共用 _add_new_word 统计生词
+        for fmt in ('stream', 'pack'):
+            lines = {}
+            for tokens in (2000, 10000):
+                srt = os.path.join(tmpdir, f'bench-{tokens}.srt')
+                _synthetic_srt(srt, tokens, tokens // 4)
+                result = {}
+                out = os.path.join(tmpdir, f'bench.{fmt}')
+                lines[tokens] = _count_lines(lambda: result.update(lab.process_subtitle_file(srt, out, fmt=fmt)))
+                assert result['statistics']['new_words_count'] == tokens // 4
+            # 词数 x5，线性实现约 x5；平方级实现会超过 x25
+            ratio = lines[10000] / lines[2000]
+            assert ratio < 7, (fmt, ratio)
+            print(f"  ✓ {fmt}: 操作数比 {ratio:.1f}（词数比 5）")
+    finally:
+        label.invalidate_shared_dict()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_shared_dict()
+    test_profile_cache_bounded()
+    test_batched_lookup()
+    test_stream_output()
+    test_pack_output()
+    test_label_files_parallel()
+    test_multi_level()
+    test_lemma_lookup()
+    test_levels_sidecar()
+    test_cli_arguments()
+    test_new_words_linear_scaling()
+    print("✅ 所有测试完成")
@@ -3,7 +3,7 @@
 """
 
 import json
-from vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string
+from vocab_level import VocabLevelChecker, VocabLevel, get_level_from_string, tag_mask
 
 
 def test_level_checker():
@@ -102,10 +102,57 @@ def test_frequency_based_check():
         print(f"  {word:20} (BNC={bnc:6}) - {status:10} - {difficulty}")
 
 
+def test_profile_classify():
+    """测试预计算位掩码分级与逐项判断一致"""
+    print("\n" + "=" * 60)
+    print("测试 4: 位掩码分级")
+    print("=" * 60)
+
+    entries = [
+        {'word': 'hello', 'tag': 'zk gk', 'bnc': '500'},
+        {'word': 'abandon', 'tag': 'cet4 cet6', 'bnc': '3500'},
+        {'word': 'paradigm', 'tag': 'gre', 'bnc': '15000'},
+        {'word': 'essay', 'tag': 'ielts', 'bnc': '4000'},
+        {'word': 'medium_word', 'tag': '', 'bnc': '6000'},
+        {'word': 'no_bnc', 'tag': '', 'bnc': ''},
+        {'word': 'bad_bnc', 'tag': 'unknown', 'bnc': 'n/a'},
+        {},
+    ]
+    expected = {
+        'cet4': [(False, '基础词汇'), (True, '六级词汇'), (True, 'GRE词汇'), (True, '雅思词汇'),
+                 (True, '中频词'), (True, '低频词'), (True, '未分级'), (True, '未收录')],
+        'toefl': [(False, '基础词汇'), (False, '六级词汇'), (True, 'GRE词汇'), (True, '雅思词汇'),
+                  (False, '中频词'), (True, '低频词'), (True, '未分级'), (True, '未收录')],
+        'advanced': [(False, '基础词汇'), (False, '六级词汇'), (False, 'GRE词汇'), (False, '雅思词汇'),
+                     (False, '中频词'), (False, '低频词'), (False, '未分级'), (True, '未收录')],
+    }
+
+    profiles = {}
+    for level_str, results in expected.items():
+        checker = VocabLevelChecker(get_level_from_string(level_str), profiles=profiles)
+        for entry, result in zip(entries, results):
+            word = entry.get('word', 'missing')
+            assert checker.classify(word, entry) == result, (level_str, word)
+            assert (checker.is_beyond_level(word, entry), checker.get_difficulty_label(word, entry)) == result
+        assert checker.classify('The', {}) == (False, '常用词')
+
+    # 检查器之间共享缓存，每个词只计算一次
+    assert len(profiles) == len(entries) - 1
+    assert profiles['abandon'] == (tag_mask('cet4 cet6'), 3500)
+
+    # 默认不缓存：同一个单词的词条变化后，结果随之变化
+    checker = VocabLevelChecker(VocabLevel.CET4)
+    assert checker.is_beyond_level('x', {'word': 'x', 'tag': 'gre'})
+    assert not checker.is_beyond_level('x', {'word': 'x', 'tag': 'cet4'})
+    assert checker.get_difficulty_label('x', {'word': 'x', 'tag': 'cet4'}) == '四级词汇'
+    assert checker.profiles is None
+    print("  ✓ classify 与 is_beyond_level / get_difficulty_label 一致")
+
+
 def test_output_structure():
     """测试输出数据结构示例"""
     print("\n" + "=" * 60)
-    print("测试 4: 输出 JSON 结构示例")
+    print("测试 5: 输出 JSON 结构示例")
     print("=" * 60)
 
     # 模拟 label.py 的输出结构
@@ -178,6 +225,7 @@ if __name__ == '__main__':
     test_level_checker()
     test_tag_parsing()
     test_frequency_based_check()
+    test_profile_classify()
     test_output_structure()
 
     print("\n" + "=" * 60)
@@ -3,7 +3,7 @@
 定义词汇量等级体系和判断逻辑
 """
 
-from typing import Set, List
+from typing import Set, List, Dict, Tuple, Optional
 from enum import Enum
 
 
@@ -53,18 +53,142 @@ COMMON_WORDS = {
 }
 
 
+# 每个等级在位掩码中的位
+LEVEL_BITS = {level: 1 << i for i, level in enumerate(VocabLevel)}
+
+# 无等级标签时，各用户等级的 BNC 词频阈值
+FREQUENCY_THRESHOLDS = {
+    VocabLevel.BASIC: 3000,
+    VocabLevel.CET4: 5000,
+    VocabLevel.CET6: 8000,
+    VocabLevel.TOEFL: 12000,
+    VocabLevel.IELTS: 12000,
+    VocabLevel.GRE: 20000,
+    VocabLevel.ADVANCED: 99999,
+}
+
+# 难度标签取最高等级
+LEVEL_PRIORITY = [
+    VocabLevel.GRE,
+    VocabLevel.TOEFL,
+    VocabLevel.IELTS,
+    VocabLevel.CET6,
+    VocabLevel.CET4,
+    VocabLevel.BASIC
+]
+
+LEVEL_LABELS = {
+    VocabLevel.GRE: "GRE词汇",
+    VocabLevel.TOEFL: "托福词汇",
+    VocabLevel.IELTS: "雅思词汇",
+    VocabLevel.CET6: "六级词汇",
+    VocabLevel.CET4: "四级词汇",
+    VocabLevel.BASIC: "基础词汇"
+}
+
+# 无法解析的 BNC 词频
+BNC_INVALID = -1
+
+# tag 字符串 -> 等级位掩码（不同的 tag 组合只有几十种）
+_tag_masks: Dict[str, int] = {}
+
+
+def tag_mask(tag_string: str) -> int:
+    """把词库 tag 字段转为等级位掩码，结果按 tag 字符串缓存。"""
+    if not tag_string:
+        return 0
+    mask = _tag_masks.get(tag_string)
+    if mask is None:
+        mask = 0
+        for tag in tag_string.lower().split():
+            if tag in TAG_TO_LEVEL:
+                mask |= LEVEL_BITS[TAG_TO_LEVEL[tag]]
+        _tag_masks[tag_string] = mask
+    return mask
+
+
+def tag_bits_masks(tags: Tuple[str, ...]) -> List[int]:
+    """
+    把按位编码的标签（第 i 位表示 tags[i]，如 stardict.LEVEL_TAGS）转为等级位掩码
+
+    Returns:
+        长度为 2 ** len(tags) 的表，下标为标签位，值为等级位掩码
+    """
+    masks = [0] * (1 << len(tags))
+    for bits in range(len(masks)):
+        for i, tag in enumerate(tags):
+            if bits & (1 << i) and tag in TAG_TO_LEVEL:
+                masks[bits] |= LEVEL_BITS[TAG_TO_LEVEL[tag]]
+    return masks
+
+
+def word_profile(word_entry: dict) -> Optional[Tuple[int, int]]:
+    """
+    预先计算单词的分级信息
+
+    Args:
+        word_entry: 词库条目
+
+    Returns:
+        (等级位掩码, BNC 词频)，词频缺失记为 99999、无法解析记为 BNC_INVALID；
+        词库中没有该词时返回 None
+    """
+    if not word_entry or not word_entry.get('word'):
+        return None
+    try:
+        bnc = int(word_entry.get('bnc', '99999') or '99999')
+    except ValueError:
+        bnc = BNC_INVALID
+    return tag_mask(word_entry.get('tag', '')), bnc
+
+
+def _mask_label(mask: int) -> str:
+    for level in LEVEL_PRIORITY:
+        if mask & LEVEL_BITS[level]:
+            return LEVEL_LABELS[level]
+    return "未分级"
+
+
+# 等级位掩码 -> 难度标签
+MASK_LABELS = [_mask_label(mask) for mask in range(1 << len(LEVEL_BITS))]
+
+
+def profile_label(profile: Optional[Tuple[int, int]]) -> str:
+    """由 word_profile 的结果得到难度标签（与用户等级无关）"""
+    if profile is None:
+        return "未收录"
+    mask, bnc = profile
+    if mask:
+        return MASK_LABELS[mask]
+    if bnc == BNC_INVALID:
+        return "未分级"
+    if bnc <= 3000:
+        return "高频词"
+    elif bnc <= 8000:
+        return "中频词"
+    return "低频词"
+
+
 class VocabLevelChecker:
     """词汇难度检查器"""
 
-    def __init__(self, user_level: VocabLevel = VocabLevel.CET4):
+    def __init__(self, user_level: VocabLevel = VocabLevel.CET4, profiles: Dict[str, Tuple[int, int]] = None):
         """
         初始化检查器
 
         Args:
             user_level: 用户当前词汇量等级
+            profiles: 单词 -> word_profile 结果的缓存，可在多个检查器之间共享；
+                默认不缓存，每次按词条内容计算。缓存以单词为键，调用方须保证
+                同一个单词的词条不变（如 Labeler 按词典实例共享）
         """
         self.user_level = user_level
         self.covered_levels = self._get_covered_levels(user_level)
+        self.covered_mask = 0
+        for level in self.covered_levels:
+            self.covered_mask |= LEVEL_BITS[level]
+        self.threshold = FREQUENCY_THRESHOLDS.get(user_level, 5000)
+        self.profiles = profiles
 
     def _get_covered_levels(self, level: VocabLevel) -> Set[VocabLevel]:
         """获取用户已掌握的所有等级（包含下级）"""
@@ -82,17 +206,63 @@ class VocabLevelChecker:
         Returns:
             该词所属的等级集合
         """
-        if not tag_string:
-            return set()
+        mask = tag_mask(tag_string)
+        return {level for level, bit in LEVEL_BITS.items() if mask & bit}
 
-        tags = tag_string.lower().split()
-        levels = set()
+    def profile(self, word_entry: dict) -> Optional[Tuple[int, int]]:
+        """返回词条的 (等级位掩码, BNC 词频)，有 profiles 缓存时同一个词只计算一次。"""
+        if not word_entry or not word_entry.get('word'):
+            return None
+        profiles = self.profiles
+        if profiles is None:
+            return word_profile(word_entry)
+        key = word_entry['word']
+        profile = profiles.get(key)
+        if profile is None:
+            profile = profiles[key] = word_profile(word_entry)
+        return profile
+
+    def load_profiles(self, words: List[str], masks: List[int], bncs: List[int], invalid: int = None):
+        """
+        批量写入预先计算好的分级信息（如 stardict.DictLevels 中按 id 取出的列）
 
-        for tag in tags:
-            if tag in TAG_TO_LEVEL:
-                levels.add(TAG_TO_LEVEL[tag])
+        Args:
+            words: 词条的 word 字段
+            masks: 等级位掩码，可用 tag_bits_masks 由标签位转换
+            bncs: BNC 词频，0 表示缺失
+            invalid: bncs 中表示无法解析的值（如 stardict.LEVEL_BNC_INVALID），记为 BNC_INVALID
+        """
+        if self.profiles is None:
+            self.profiles = {}
+        profiles = self.profiles
+        for word, mask, bnc in zip(words, masks, bncs):
+            if invalid is not None and bnc == invalid:
+                bnc = BNC_INVALID
+            profiles[word] = (mask, bnc or 99999)
+
+    def profile_beyond(self, profile: Optional[Tuple[int, int]]) -> bool:
+        """按预先计算的分级信息判断是否超纲"""
+        if profile is None:
+            return True
+        mask, bnc = profile
+        if mask:
+            # 有任何一个等级超出用户水平，则标注为超纲
+            return bool(mask & ~self.covered_mask)
+        return (99999 if bnc == BNC_INVALID else bnc) > self.threshold
 
-        return levels
+    def classify(self, word: str, word_entry: dict) -> Tuple[bool, str]:
+        """
+        一次得到 (是否超纲, 难度标签)，等价于分别调用
+        is_beyond_level 与 get_difficulty_label
+
+        Args:
+            word: 单词原文
+            word_entry: 词库条目
+        """
+        if word.lower() in COMMON_WORDS:
+            return False, "常用词"
+        profile = self.profile(word_entry)
+        return self.profile_beyond(profile), profile_label(profile)
 
     def is_beyond_level(self, word: str, word_entry: dict) -> bool:
         """
@@ -108,26 +278,8 @@ class VocabLevelChecker:
         # 如果是常用词，不标注
         if word.lower() in COMMON_WORDS:
             return False
-
-        # 如果词库中没有信息，保守标注为超纲
-        if not word_entry or not word_entry.get('word'):
-            return True
-
-        # 获取该词的等级标签
-        tag_string = word_entry.get('tag', '')
-        word_levels = self.parse_word_tags(tag_string)
-
-        # 如果没有等级标签，根据词频判断
-        if not word_levels:
-            return self._check_by_frequency(word_entry)
-
-        # 判断该词的所有等级是否都在用户已掌握范围内
-        # 如果有任何一个等级超出用户水平，则标注为超纲
-        for wl in word_levels:
-            if wl not in self.covered_levels:
-                return True
-
-        return False
+        # 词库中没有信息时保守标注为超纲；没有等级标签时根据词频判断
+        return self.profile_beyond(self.profile(word_entry))
 
     def _check_by_frequency(self, word_entry: dict) -> bool:
         """
@@ -145,20 +297,7 @@ class VocabLevelChecker:
             bnc = int(word_entry.get('bnc', '99999') or '99999')
         except ValueError:
             bnc = 99999
-
-        # 根据用户等级设定词频阈值
-        frequency_thresholds = {
-            VocabLevel.BASIC: 3000,
-            VocabLevel.CET4: 5000,
-            VocabLevel.CET6: 8000,
-            VocabLevel.TOEFL: 12000,
-            VocabLevel.IELTS: 12000,
-            VocabLevel.GRE: 20000,
-            VocabLevel.ADVANCED: 99999,
-        }
-
-        threshold = frequency_thresholds.get(self.user_level, 5000)
-        return bnc > threshold
+        return bnc > self.threshold
 
     def get_difficulty_label(self, word: str, word_entry: dict) -> str:
         """
@@ -173,50 +312,7 @@ class VocabLevelChecker:
         """
         if word.lower() in COMMON_WORDS:
             return "常用词"
-
-        if not word_entry or not word_entry.get('word'):
-            return "未收录"
-
-        tag_string = word_entry.get('tag', '')
-        word_levels = self.parse_word_tags(tag_string)
-
-        if not word_levels:
-            # 根据词频判断
-            try:
-                bnc = int(word_entry.get('bnc', '99999') or '99999')
-            except ValueError:
-                return "未分级"
-
-            if bnc <= 3000:
-                return "高频词"
-            elif bnc <= 8000:
-                return "中频词"
-            else:
-                return "低频词"
-
-        # 返回最高等级标签
-        level_priority = [
-            VocabLevel.GRE,
-            VocabLevel.TOEFL,
-            VocabLevel.IELTS,
-            VocabLevel.CET6,
-            VocabLevel.CET4,
-            VocabLevel.BASIC
-        ]
-
-        for level in level_priority:
-            if level in word_levels:
-                label_map = {
-                    VocabLevel.GRE: "GRE词汇",
-                    VocabLevel.TOEFL: "托福词汇",
-                    VocabLevel.IELTS: "雅思词汇",
-                    VocabLevel.CET6: "六级词汇",
-                    VocabLevel.CET4: "四级词汇",
-                    VocabLevel.BASIC: "基础词汇"
-                }
-                return label_map.get(level, "未分级")
-
-        return "未分级"
+        return profile_label(self.profile(word_entry))
 
 
 def get_level_from_string(level_str: str) -> VocabLevel: